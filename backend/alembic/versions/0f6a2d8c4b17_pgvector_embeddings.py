@@ -0,0 +1,79 @@
+"""pgvector embeddings
+
+Revision ID: 0f6a2d8c4b17
+Revises: e7b04d93a1c6
+Create Date: 2026-10-16 16:48:10.275391
+
+"""
+import json
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0f6a2d8c4b17'
+down_revision: Union[str, Sequence[str], None] = 'e7b04d93a1c6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+
+def _pgvector_available() -> bool:
+    # Only Postgres servers with the extension installed get the column; everything else is a no-op
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return False
+    return bind.execute(sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'vector'")).first() is not None
+
+
+def _backfill(dim: int) -> None:
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(sa.text("""
+            SELECT id, embedding_blob, embedding_dtype, embedding_json FROM note_embeddings
+            WHERE id > :last_id AND embedding_vec IS NULL
+            ORDER BY id LIMIT :limit
+        """), {'last_id': last_id, 'limit': BATCH_SIZE}).all()
+        if not rows:
+            break
+        for row_id, blob, dtype, embedding_json in rows:
+            if blob is not None:
+                vec = np.frombuffer(blob, dtype=np.dtype(dtype or '<f4'))
+            else:
+                vec = np.asarray(json.loads(embedding_json), dtype='<f4')
+            if vec.shape[0] != dim:
+                continue  # a different model's vectors; left for the numpy path
+            bind.execute(
+                sa.text("UPDATE note_embeddings SET embedding_vec = CAST(:vec AS vector) WHERE id = :id"),
+                {'vec': '[' + ','.join(repr(float(x)) for x in vec) + ']', 'id': row_id},
+            )
+        last_id = rows[-1][0]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not _pgvector_available():
+        return
+    dim = int(os.getenv('PGVECTOR_DIM', '384'))
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    op.execute(f"ALTER TABLE note_embeddings ADD COLUMN IF NOT EXISTS embedding_vec vector({dim})")
+    _backfill(dim)
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_note_embeddings_embedding_vec "
+        "ON note_embeddings USING hnsw (embedding_vec vector_cosine_ops)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("DROP INDEX IF EXISTS ix_note_embeddings_embedding_vec")
+    op.execute("ALTER TABLE note_embeddings DROP COLUMN IF EXISTS embedding_vec")
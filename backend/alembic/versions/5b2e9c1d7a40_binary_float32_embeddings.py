@@ -0,0 +1,99 @@
+"""binary float32 embeddings
+
+Revision ID: 5b2e9c1d7a40
+Revises: 31635af48af6
+Create Date: 2026-10-16 09:12:41.508312
+
+"""
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b2e9c1d7a40'
+down_revision: Union[str, Sequence[str], None] = '31635af48af6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+note_embeddings = sa.table(
+    'note_embeddings',
+    sa.column('id', sa.Integer()),
+    sa.column('embedding_json', sa.Text()),
+    sa.column('embedding_blob', sa.LargeBinary()),
+    sa.column('embedding_dtype', sa.String()),
+    sa.column('embedding_dim', sa.Integer()),
+)
+
+
+def _backfill_blobs() -> None:
+    # Walk by id so the backfill runs in bounded batches on large tables
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(note_embeddings.c.id, note_embeddings.c.embedding_json)
+            .where(note_embeddings.c.id > last_id)
+            .where(note_embeddings.c.embedding_blob.is_(None))
+            .where(note_embeddings.c.embedding_json.is_not(None))
+            .order_by(note_embeddings.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        for row_id, embedding_json in rows:
+            vec = np.asarray(json.loads(embedding_json), dtype='<f4')
+            bind.execute(
+                note_embeddings.update()
+                .where(note_embeddings.c.id == row_id)
+                .values(embedding_blob=vec.tobytes(), embedding_dtype='<f4', embedding_dim=int(vec.shape[0]))
+            )
+        last_id = rows[-1][0]
+
+
+def _backfill_json() -> None:
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(note_embeddings.c.id, note_embeddings.c.embedding_blob, note_embeddings.c.embedding_dtype)
+            .where(note_embeddings.c.id > last_id)
+            .where(note_embeddings.c.embedding_json.is_(None))
+            .order_by(note_embeddings.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        for row_id, blob, dtype in rows:
+            vec = np.frombuffer(blob, dtype=np.dtype(dtype or '<f4'))
+            bind.execute(
+                note_embeddings.update()
+                .where(note_embeddings.c.id == row_id)
+                .values(embedding_json=json.dumps(vec.astype(float).tolist()))
+            )
+        last_id = rows[-1][0]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('note_embeddings') as batch_op:
+        batch_op.add_column(sa.Column('embedding_blob', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('embedding_dtype', sa.String(length=16), nullable=True))
+        batch_op.add_column(sa.Column('embedding_dim', sa.Integer(), nullable=True))
+        batch_op.alter_column('embedding_json', existing_type=sa.Text(), nullable=True)
+    _backfill_blobs()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _backfill_json()
+    with op.batch_alter_table('note_embeddings') as batch_op:
+        batch_op.alter_column('embedding_json', existing_type=sa.Text(), nullable=False)
+        batch_op.drop_column('embedding_dim')
+        batch_op.drop_column('embedding_dtype')
+        batch_op.drop_column('embedding_blob')
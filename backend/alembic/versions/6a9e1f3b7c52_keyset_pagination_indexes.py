@@ -0,0 +1,32 @@
+"""keyset pagination indexes
+
+Revision ID: 6a9e1f3b7c52
+Revises: 0f6a2d8c4b17
+Create Date: 2026-10-16 17:31:56.662020
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6a9e1f3b7c52'
+down_revision: Union[str, Sequence[str], None] = '0f6a2d8c4b17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_notes_user_id_created_at_id', 'notes', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_notes_user_id_book_id_created_at_id', 'notes', ['user_id', 'book_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_books_user_id_created_at_id', 'books', ['user_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_books_user_id_created_at_id', table_name='books')
+    op.drop_index('ix_notes_user_id_book_id_created_at_id', table_name='notes')
+    op.drop_index('ix_notes_user_id_created_at_id', table_name='notes')
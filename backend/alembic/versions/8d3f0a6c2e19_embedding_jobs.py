@@ -0,0 +1,46 @@
+"""embedding jobs
+
+Revision ID: 8d3f0a6c2e19
+Revises: 5b2e9c1d7a40
+Create Date: 2026-10-16 11:40:03.114927
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d3f0a6c2e19'
+down_revision: Union[str, Sequence[str], None] = '5b2e9c1d7a40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('embedding_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('note_id', sa.Integer(), nullable=False),
+    sa.Column('model_name', sa.String(length=255), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['note_id'], ['notes.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_embedding_jobs_id'), 'embedding_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_embedding_jobs_note_id'), 'embedding_jobs', ['note_id'], unique=False)
+    op.create_index(op.f('ix_embedding_jobs_status'), 'embedding_jobs', ['status'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_embedding_jobs_status'), table_name='embedding_jobs')
+    op.drop_index(op.f('ix_embedding_jobs_note_id'), table_name='embedding_jobs')
+    op.drop_index(op.f('ix_embedding_jobs_id'), table_name='embedding_jobs')
+    op.drop_table('embedding_jobs')
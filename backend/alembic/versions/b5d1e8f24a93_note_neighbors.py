@@ -0,0 +1,42 @@
+"""note neighbors
+
+Revision ID: b5d1e8f24a93
+Revises: 6a9e1f3b7c52
+Create Date: 2026-10-17 00:22:41.305118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d1e8f24a93'
+down_revision: Union[str, Sequence[str], None] = '6a9e1f3b7c52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('note_neighbors',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('note_id', sa.Integer(), nullable=False),
+    sa.Column('model_name', sa.String(length=255), nullable=False),
+    sa.Column('neighbor_ids', sa.LargeBinary(), nullable=False),
+    sa.Column('scores', sa.LargeBinary(), nullable=False),
+    sa.Column('kth_score', sa.Float(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['note_id'], ['notes.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_note_neighbors_id'), 'note_neighbors', ['id'], unique=False)
+    op.create_index('ix_note_neighbors_note_id_model_name', 'note_neighbors', ['note_id', 'model_name'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_note_neighbors_note_id_model_name', table_name='note_neighbors')
+    op.drop_index(op.f('ix_note_neighbors_id'), table_name='note_neighbors')
+    op.drop_table('note_neighbors')
@@ -0,0 +1,47 @@
+"""cluster results
+
+Revision ID: c41a7e52b9d8
+Revises: 8d3f0a6c2e19
+Create Date: 2026-10-16 14:05:27.830162
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41a7e52b9d8'
+down_revision: Union[str, Sequence[str], None] = '8d3f0a6c2e19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('cluster_results',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=True),
+    sa.Column('k', sa.Integer(), nullable=False),
+    sa.Column('model_name', sa.String(length=255), nullable=False),
+    sa.Column('content_version', sa.String(length=64), nullable=False),
+    sa.Column('fitted_count', sa.Integer(), nullable=False),
+    sa.Column('fitted_spread', sa.Float(), nullable=False),
+    sa.Column('note_ids', sa.LargeBinary(), nullable=False),
+    sa.Column('labels', sa.LargeBinary(), nullable=False),
+    sa.Column('centroids', sa.LargeBinary(), nullable=False),
+    sa.Column('result_json', sa.Text(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_cluster_results_id'), 'cluster_results', ['id'], unique=False)
+    op.create_index(op.f('ix_cluster_results_user_id'), 'cluster_results', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_cluster_results_user_id'), table_name='cluster_results')
+    op.drop_index(op.f('ix_cluster_results_id'), table_name='cluster_results')
+    op.drop_table('cluster_results')
@@ -0,0 +1,68 @@
+"""embedding model versions
+
+Revision ID: d2c7f5a19e34
+Revises: b5d1e8f24a93
+Create Date: 2026-10-17 01:04:18.662930
+
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2c7f5a19e34'
+down_revision: Union[str, Sequence[str], None] = 'b5d1e8f24a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+note_embeddings = sa.table(
+    'note_embeddings',
+    sa.column('id', sa.Integer()),
+    sa.column('note_id', sa.Integer()),
+    sa.column('model_name', sa.String()),
+)
+
+app_settings = sa.table(
+    'app_settings',
+    sa.column('key', sa.String()),
+    sa.column('value', sa.Text()),
+    sa.column('updated_at', sa.DateTime(timezone=True)),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    # Keep the newest row of any (note_id, model_name) duplicates so the unique index can be built
+    newest = (
+        sa.select(sa.func.max(note_embeddings.c.id))
+        .group_by(note_embeddings.c.note_id, note_embeddings.c.model_name)
+        .scalar_subquery()
+    )
+    bind.execute(note_embeddings.delete().where(note_embeddings.c.id.not_in(newest)))
+    op.create_index('ix_note_embeddings_note_id_model_name', 'note_embeddings', ['note_id', 'model_name'], unique=True)
+
+    op.create_table('app_settings',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('value', sa.Text(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    # Pin search to the model the existing vectors were written with
+    model_name = bind.execute(
+        sa.select(note_embeddings.c.model_name)
+        .group_by(note_embeddings.c.model_name)
+        .order_by(sa.func.count().desc())
+        .limit(1)
+    ).scalar()
+    if model_name is not None:
+        bind.execute(app_settings.insert().values(key='embedding_model', value=model_name, updated_at=datetime.now(timezone.utc)))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('app_settings')
+    op.drop_index('ix_note_embeddings_note_id_model_name', table_name='note_embeddings')
@@ -0,0 +1,62 @@
+"""notes full text index
+
+Revision ID: e7b04d93a1c6
+Revises: c41a7e52b9d8
+Create Date: 2026-10-16 15:22:48.407715
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b04d93a1c6'
+down_revision: Union[str, Sequence[str], None] = 'c41a7e52b9d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        # External-content FTS5 table over notes.text, kept in sync by triggers
+        op.execute("CREATE VIRTUAL TABLE notes_fts USING fts5(text, content='notes', content_rowid='id')")
+        op.execute("""
+            CREATE TRIGGER notes_fts_ai AFTER INSERT ON notes BEGIN
+                INSERT INTO notes_fts(rowid, text) VALUES (new.id, new.text);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER notes_fts_ad AFTER DELETE ON notes BEGIN
+                INSERT INTO notes_fts(notes_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER notes_fts_au AFTER UPDATE OF text ON notes BEGIN
+                INSERT INTO notes_fts(notes_fts, rowid, text) VALUES ('delete', old.id, old.text);
+                INSERT INTO notes_fts(rowid, text) VALUES (new.id, new.text);
+            END
+        """)
+        op.execute("INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')")
+    elif dialect == 'postgresql':
+        op.execute(
+            "ALTER TABLE notes ADD COLUMN text_tsv tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', text)) STORED"
+        )
+        op.execute("CREATE INDEX ix_notes_text_tsv ON notes USING GIN (text_tsv)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS notes_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS notes_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS notes_fts_ai")
+        op.execute("DROP TABLE IF EXISTS notes_fts")
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_notes_text_tsv")
+        op.execute("ALTER TABLE notes DROP COLUMN IF EXISTS text_tsv")
@@ -0,0 +1,75 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+from clusters import kmeans_clusters
+
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "2000"))
+ANN_DEFAULT_NPROBE = int(os.getenv("ANN_DEFAULT_NPROBE", "8"))
+# Centroids are fit on a sample of at most this many rows per list
+ANN_TRAIN_PER_LIST = 40
+# Refit once the index has grown this much past the size it was trained on
+ANN_REBUILD_GROWTH = 2.0
+
+
+class IVFIndex:
+    """Inverted-file index: k-means centroids plus the row positions assigned to each."""
+
+    def __init__(self, centroids: np.ndarray, lists: list[np.ndarray], size: int, trained_size: int):
+        self.centroids = centroids
+        self.lists = lists
+        self.size = size
+        self.trained_size = trained_size
+
+    @property
+    def n_lists(self) -> int:
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, n_lists: Optional[int] = None, seed: int = 42) -> "IVFIndex":
+        n = matrix.shape[0]
+        n_lists = n_lists or max(1, min(1024, int(np.sqrt(n))))
+        train = matrix
+        if n > n_lists * ANN_TRAIN_PER_LIST:
+            rng = np.random.default_rng(seed)
+            train = matrix[rng.choice(n, n_lists * ANN_TRAIN_PER_LIST, replace=False)]
+        _, centers = kmeans_clusters(train, k=n_lists, seed=seed, n_init=1)
+        centroids = _normalize(np.asarray(centers, dtype=np.float32))
+        lists = [np.empty(0, dtype=np.int64) for _ in range(n_lists)]
+        ivf = cls(centroids, lists, 0, n)
+        return ivf.extend(matrix)
+
+    def assign(self, vecs: np.ndarray) -> np.ndarray:
+        return np.argmax(vecs @ self.centroids.T, axis=1)
+
+    def extend(self, matrix: np.ndarray) -> "IVFIndex":
+        """Return a copy that also covers rows [self.size, len(matrix)) of matrix."""
+        n = matrix.shape[0]
+        if n <= self.size:
+            return self
+        labels = self.assign(matrix[self.size:n])
+        lists = list(self.lists)
+        positions = np.arange(self.size, n, dtype=np.int64)
+        for label in np.unique(labels):
+            lists[label] = np.concatenate([lists[label], positions[labels == label]])
+        return IVFIndex(self.centroids, lists, n, self.trained_size)
+
+    def candidates(self, q_vec: np.ndarray, nprobe: int) -> np.ndarray:
+        nprobe = min(nprobe, self.n_lists)
+        probe = np.argpartition(-(self.centroids @ q_vec), nprobe - 1)[:nprobe]
+        return np.concatenate([self.lists[i] for i in probe])
+
+    def needs_rebuild(self, n: int) -> bool:
+        return n > self.trained_size * ANN_REBUILD_GROWTH
+
+
+def recall_at_k(exact: list[list[int]], approx: list[list[int]]) -> float:
+    """Mean fraction of each exact top-k id list that the approximate search also returned."""
+    hits = [len(set(e) & set(a)) / len(e) for e, a in zip(exact, approx) if e]
+    return float(np.mean(hits)) if hits else 1.0
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    return m / np.where(norms == 0, 1, norms)
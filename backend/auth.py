@@ -1,10 +1,20 @@
+import hashlib
+import json
+import logging
 import os
+import threading
+import time
+from collections import OrderedDict
 from typing import Optional
 
 import jwt
-from jwt import PyJWKClient
+from jwt import PyJWK, PyJWKClient, PyJWKSet
 from fastapi import Header, HTTPException, status
 
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
 PROJECT_REF = "rnfllusylhuzshbcqvsv"
 
 JWKS_URL = os.getenv(
@@ -15,20 +25,135 @@ ISSUER = os.getenv(
     "SUPABASE_ISSUER",
     f"https://{PROJECT_REF}.supabase.co/auth/v1",
 )
+# A local JWKS document to use instead of fetching JWKS_URL (offline runs, tests)
+JWKS_FILE = os.getenv("SUPABASE_JWKS_FILE")
+JWKS_REFRESH_SECONDS = float(os.getenv("JWKS_REFRESH_SECONDS", "600"))
+JWKS_FETCH_TIMEOUT = float(os.getenv("JWKS_FETCH_TIMEOUT", "5"))
+# An unknown kid triggers a refetch at most this often, so bad tokens cannot hammer the endpoint
+JWKS_MIN_REFETCH_SECONDS = 30.0
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+
+class KeyStore:
+    """Signing keys by kid, refreshed in the background.
+
+    A failed refresh keeps the last good key set, so a JWKS endpoint blip does
+    not turn into 401s for every request.
+    """
+
+    def __init__(self, url: str = JWKS_URL, path: Optional[str] = JWKS_FILE):
+        self.url = url
+        self.path = path
+        self._client: Optional[PyJWKClient] = None
+        self._keys: dict[str, PyJWK] = {}
+        self._last_attempt: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._keys)
+
+    def _fetch(self) -> dict:
+        if self.path:
+            with open(self.path) as f:
+                return json.load(f)
+        if self._client is None:
+            self._client = PyJWKClient(self.url, cache_jwk_set=False, timeout=JWKS_FETCH_TIMEOUT)
+        return self._client.fetch_data()
+
+    def refresh(self) -> bool:
+        with self._lock:
+            self._last_attempt = time.monotonic()
+            try:
+                jwk_set = PyJWKSet.from_dict(self._fetch())
+            except Exception:
+                logger.warning("JWKS refresh failed; keeping %d cached keys", len(self._keys), exc_info=True)
+                return False
+            self._keys = {key.key_id: key for key in jwk_set.keys if key.key_id}
+            return True
+
+    def get(self, kid: Optional[str]) -> Optional[PyJWK]:
+        key = self._keys.get(kid)
+        if key is None and (self._last_attempt is None or time.monotonic() - self._last_attempt > JWKS_MIN_REFETCH_SECONDS):
+            # Key rotation: the token may be signed by a key published since the last refresh
+            self.refresh()
+            key = self._keys.get(kid)
+        return key
+
+    def start(self, interval: float = JWKS_REFRESH_SECONDS) -> None:
+        if self._thread is not None:
+            return
+        self._stopping.clear()
 
-_jwk_client = PyJWKClient(JWKS_URL)
+        def run():
+            while not self._stopping.is_set():
+                self.refresh()
+                self._stopping.wait(interval)
+
+        self._thread = threading.Thread(target=run, name="jwks-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+class TokenCache:
+    """LRU of verified tokens (by SHA-256) to user id; each entry lives until the token's exp."""
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, user_id: str, exp: float) -> None:
+        with self._lock:
+            self._entries[key] = (user_id, exp)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+key_store = KeyStore()
+token_cache = TokenCache()
 
 def get_current_user_id(authorization: Optional[str] = Header(default=None)) -> str:
+    with span("auth"):
+        return _verify(authorization)
+
+def _verify(authorization: Optional[str]) -> str:
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing bearer token")
 
     token = authorization.split(" ", 1)[1].strip()
 
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+    user_id = token_cache.get(cache_key)
+    if user_id is not None:
+        return user_id
+
     try:
-        signing_key = _jwk_client.get_signing_key_from_jwt(token).key
+        signing_key = key_store.get(jwt.get_unverified_header(token).get("kid"))
+        if signing_key is None:
+            raise jwt.InvalidTokenError("unknown signing key")
         payload = jwt.decode(
             token,
-            signing_key,
+            signing_key.key,
             algorithms=["ES256"],
             issuer=ISSUER,
             options={"verify_aud": False},
@@ -39,4 +164,6 @@ def get_current_user_id(authorization: Optional[str] = Header(default=None)) ->
     user_id = payload.get("sub")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token missing sub")
+    if payload.get("exp") is not None:
+        token_cache.put(cache_key, user_id, float(payload["exp"]))
     return user_id
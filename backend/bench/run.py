@@ -0,0 +1,300 @@
+"""Offline benchmarks for the search, clustering, ingest and auth hot paths.
+
+    cd backend
+    python -m bench.run --sizes 1000,10000 --out bench.json
+    python -m bench.run --sizes 1000,10000 --compare bench.json
+
+Runs against a throwaway SQLite database with a deterministic stub embedding
+model and a local JWKS server, so it needs no network, GPU or model download.
+Each user is seeded with clustered random unit vectors and synthetic texts.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+VOCAB_SIZE = 3000
+N_TOPICS = 50
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def rss_mb() -> Optional[float]:
+    """Current resident set size; None where /proc is unavailable (macOS)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return None
+
+
+class RssSampler:
+    """Highest RSS seen while a benchmark runs, sampled from a background thread.
+
+    ru_maxrss is the peak of the whole process, so after the first large
+    allocation it repeats for every later benchmark; sampling the current RSS
+    gives each benchmark its own peak. Falls back to the ru_maxrss growth
+    (0 when the process peak is not exceeded) without /proc.
+    """
+
+    def __init__(self, interval: float = 0.002):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+    def __enter__(self):
+        self.start = rss_mb()
+        self._maxrss = peak_rss_mb()
+        if self.start is not None:
+            self.peak = self.start
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is None:
+            self.start, self.peak = self._maxrss, peak_rss_mb()
+            return False
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_mb())
+        return False
+
+
+def measure(name: str, size: int, fn: Callable[[int], object], repeat: int, warmup: int = 3) -> dict:
+    for i in range(warmup):
+        fn(i)
+    times = np.empty(repeat)
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        for i in range(repeat):
+            t0 = time.perf_counter()
+            fn(i)
+            times[i] = time.perf_counter() - t0
+        elapsed = time.perf_counter() - start
+    ms = times * 1000
+    result = {
+        "name": name,
+        "size": size,
+        "count": repeat,
+        "mean_ms": round(float(ms.mean()), 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p90_ms": round(float(np.percentile(ms, 90)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "ops_per_s": round(repeat / elapsed, 2),
+        "rss_mb": round(rss.start, 1),
+        # Peak memory this benchmark added on top of what the process already held
+        "peak_rss_delta_mb": round(rss.peak - rss.start, 1),
+    }
+    print(f"{name:<32} n={size:<7} p50={result['p50_ms']:>9.3f}ms p99={result['p99_ms']:>9.3f}ms "
+          f"{result['ops_per_s']:>9.1f} op/s  rss={result['rss_mb']}MB +{result['peak_rss_delta_mb']}MB", flush=True)
+    return result
+
+
+def synthetic_corpus(n: int, seed: int, dim: int = 384) -> tuple[list[str], np.ndarray]:
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f"w{i}" for i in range(VOCAB_SIZE)])
+    topics = rng.integers(0, N_TOPICS, n)
+    # Each topic draws most of its words from its own slice of the vocabulary
+    texts = []
+    for topic in topics:
+        own = rng.integers(topic * 60, topic * 60 + 60, rng.integers(6, 16))
+        noise = rng.integers(0, VOCAB_SIZE, 3)
+        texts.append(" ".join(vocab[np.concatenate([own, noise])]))
+    centers = rng.standard_normal((N_TOPICS, dim)).astype(np.float32)
+    vecs = centers[topics] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    return texts, vecs
+
+
+def seed_user(user_id: str, n: int, seed: int) -> list[str]:
+    from sqlalchemy import insert, select, func
+
+    from db import engine
+    from embedding import get_model_name
+    from models import Note, NoteEmbedding
+    from vectors import embedding_fields
+
+    texts, vecs = synthetic_corpus(n, seed)
+    now = datetime.now(timezone.utc)
+    model_name = get_model_name()
+    with engine.begin() as conn:
+        first_id = (conn.execute(select(func.max(Note.id))).scalar() or 0) + 1
+        for start in range(0, n, 5000):
+            ids = range(first_id + start, first_id + min(start + 5000, n))
+            conn.execute(insert(Note), [
+                {"id": i, "user_id": user_id, "text": texts[i - first_id], "created_at": now}
+                for i in ids
+            ])
+            conn.execute(insert(NoteEmbedding), [
+                {"note_id": i, "model_name": model_name, "created_at": now, **embedding_fields(vecs[i - first_id])}
+                for i in ids
+            ])
+    return texts
+
+
+def run(jwks, sizes: list[int], queries: int, ingest: int) -> list[dict]:
+    from fastapi.testclient import TestClient
+
+    import auth
+    import main
+    from ann import IVFIndex
+    from clusters import kmeans_clusters
+    from embedding import embed_query, query_cache
+    from index import vector_index
+    from keywords import term_index
+
+    results = []
+    rng = np.random.default_rng(0)
+
+    with TestClient(main.app) as client:
+        for n in sizes:
+            user_id = f"bench-{n}"
+            texts = seed_user(user_id, n, seed=n)
+            headers = {"Authorization": f"Bearer {jwks.token(user_id)}"}
+            sample = [texts[i] for i in rng.integers(0, n, queries)]
+            query = lambda i: " ".join(sample[i % queries].split()[:4])
+
+            # Core functions
+            results.append(measure("index.build", n, lambda i: main._build_user_index(user_id, main.get_model_name()), 1, warmup=0))
+            index = main._build_user_index(user_id, main.get_model_name())
+            matrix, index_ids, _ = index.snapshot()
+            q_vecs = matrix[rng.integers(0, n, queries)]
+            results.append(measure("index.search exact", n, lambda i: index.search(q_vecs[i % queries], 10, quantized=False), queries))
+            results.append(measure("index.search int8", n, lambda i: index.search(q_vecs[i % queries], 10, quantized=True), queries))
+            if n >= 2000:
+                index.ivf(matrix)
+                results.append(measure("index.search approx", n,
+                                       lambda i: index.search(q_vecs[i % queries], 10, mode="approx", quantized=False), queries))
+                results.append(measure("ivf.build", n, lambda i: IVFIndex.build(matrix), 1, warmup=0))
+            results.append(measure("embed_query miss", n, lambda i: (query_cache._entries.clear(), embed_query(query(i))), queries))
+            results.append(measure("embed_query hit", n, lambda i: embed_query(query(0)), queries))
+            results.append(measure("kmeans_clusters k=8", n, lambda i: kmeans_clusters(matrix, k=8), 3, warmup=0))
+            terms = main._build_term_index(user_id)
+            note_ids = list(range(1, min(n, 2000)))
+            results.append(measure("term_index.keywords", n, lambda i: terms.keywords(note_ids), 20))
+
+            token = headers["Authorization"]
+            results.append(measure("auth cold", n, lambda i: (auth.token_cache._entries.clear(), auth.get_current_user_id(token)), queries))
+            results.append(measure("auth hot", n, lambda i: auth.get_current_user_id(token), queries))
+
+            # Endpoints, end to end through the ASGI app
+            vector_index.evict((user_id, main.get_model_name()))
+            term_index.evict(user_id)
+            get = lambda path, **params: client.get(path, params=params, headers=headers).raise_for_status()
+            results.append(measure("GET /search/notes cold", n, lambda i: get("/search/notes", q=query(i)), 1, warmup=0))
+            results.append(measure("GET /search/notes exact", n, lambda i: get("/search/notes", q=query(i)), queries))
+            results.append(measure("GET /search/notes approx", n, lambda i: get("/search/notes", q=query(i), mode="approx"), queries))
+            results.append(measure("GET /search/notes hybrid", n, lambda i: get("/search/notes", q=query(i), mode="hybrid"), queries))
+            batch = lambda i: {"queries": [query(i + j) for j in range(10)], "k": 10}
+            results.append(measure("POST /search/notes/batch x10", n,
+                                   lambda i: client.post("/search/notes/batch", json=batch(i), headers=headers).raise_for_status(), queries))
+            results.append(measure("GET /clusters/recompute refit", n, lambda i: get("/clusters/recompute", k=8, refresh=True), 3, warmup=0))
+            results.append(measure("GET /clusters/recompute cached", n, lambda i: get("/clusters/recompute", k=8), 20))
+            results.append(measure("GET /notes", n, lambda i: get("/notes", limit=50), 50))
+            related = [int(i) for i in rng.choice(index_ids, min(n, queries), replace=False)]
+            results.append(measure("GET /notes/{id}/related compute", n, lambda i: get(f"/notes/{related[i]}/related"), queries, warmup=0))
+            results.append(measure("GET /notes/{id}/related stored", n, lambda i: get(f"/notes/{related[i % queries]}/related"), queries))
+
+            ingest_texts, _ = synthetic_corpus(ingest, seed=n + 1)
+            body = [{"text": t} for t in ingest_texts]
+            r = measure("POST /notes/bulk", n, lambda i: client.post("/notes/bulk", json=body, headers=headers).raise_for_status(), 1, warmup=0)
+            r["notes_per_s"] = round(ingest * r["ops_per_s"], 1)
+            results.append(r)
+            results.append(measure("POST /notes", n, lambda i: client.post("/notes", json={"text": query(i)}, headers=headers).raise_for_status(), 50))
+
+    return results
+
+
+def compare(current: list[dict], baseline_path: str) -> None:
+    baseline = {(r["name"], r["size"]): r for r in json.loads(Path(baseline_path).read_text())["results"]}
+    print(f"\n{'benchmark':<32} {'size':>7} {'base p50':>10} {'now p50':>10} {'change':>8}")
+    for r in current:
+        old = baseline.get((r["name"], r["size"]))
+        if old is None or not old["p50_ms"]:
+            continue
+        change = (r["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+        print(f"{r['name']:<32} {r['size']:>7} {old['p50_ms']:>10.3f} {r['p50_ms']:>10.3f} {change:>+7.1f}%")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated notes per synthetic user (up to 100000)")
+    parser.add_argument("--queries", type=int, default=200, help="timed iterations per hot-path benchmark")
+    parser.add_argument("--ingest", type=int, default=1000, help="notes per bulk import")
+    parser.add_argument("--out", help="write results as JSON to this path")
+    parser.add_argument("--compare", help="print p50 changes against a previous --out file")
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+
+    # Everything is configured before the app modules are imported, since they read env at import
+    workdir = tempfile.mkdtemp(prefix="reading-notes-bench-")
+    sys.path.insert(0, str(BACKEND_DIR))
+    from bench.stubs import LocalJWKS, install_stub_model
+
+    jwks = LocalJWKS().start()
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+    os.environ["SUPABASE_JWKS_URL"] = jwks.url
+    os.environ["SUPABASE_ISSUER"] = jwks.issuer
+    os.environ.pop("SUPABASE_JWKS_FILE", None)
+    os.environ.setdefault("EMBED_WORKERS", "1")
+
+    from alembic import command
+    from alembic.config import Config
+
+    command.upgrade(Config(str(BACKEND_DIR / "alembic.ini")), "head")
+    install_stub_model()
+
+    try:
+        results = run(jwks, sizes, args.queries, args.ingest)
+    finally:
+        jwks.stop()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "sizes": sizes,
+            "queries": args.queries,
+        },
+        "results": results,
+    }
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+import numpy as np
+
+DIM = 384
+
+
+class StubModel:
+    """Deterministic stand-in for SentenceTransformer: each word maps to a fixed
+    random direction and a text is the normalized sum of its words, so related
+    texts still land near each other without downloading or running a model."""
+
+    def __init__(self, dim: int = DIM):
+        self.dim = dim
+        self._words: dict[str, np.ndarray] = {}
+
+    def _word(self, word: str) -> np.ndarray:
+        vec = self._words.get(word)
+        if vec is None:
+            seed = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+            vec = self._words[word] = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return vec
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts, batch_size: int = 32, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                out[i] += self._word(word)
+        if normalize_embeddings:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            out /= np.where(norms == 0, 1, norms)
+        return out
+
+
+def install_stub_model() -> StubModel:
+    import embedding
+
+    model = StubModel()
+    embedding.get_model = lambda *args, **kwargs: model
+    return model
+
+
+class LocalJWKS:
+    """ES256 signing key plus a JWKS endpoint on 127.0.0.1, standing in for Supabase auth."""
+
+    def __init__(self, issuer: str = "http://127.0.0.1/auth/v1", kid: str = "bench"):
+        from cryptography.hazmat.primitives.asymmetric import ec
+        from jwt.algorithms import ECAlgorithm
+
+        self.issuer = issuer
+        self.kid = kid
+        self._key = ec.generate_private_key(ec.SECP256R1())
+        jwk = json.loads(ECAlgorithm.to_jwk(self._key.public_key()))
+        jwk.update(kid=kid, alg="ES256", use="sig")
+        self.jwks = {"keys": [jwk]}
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/.well-known/jwks.json"
+
+    def start(self) -> "LocalJWKS":
+        body = json.dumps(self.jwks).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, name="bench-jwks", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+    def token(self, sub: str, ttl: float = 3600) -> str:
+        import jwt
+
+        claims = {"sub": sub, "iss": self.issuer, "exp": int(time.time() + ttl)}
+        return jwt.encode(claims, self._key, algorithm="ES256", headers={"kid": self.kid})
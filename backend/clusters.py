@@ -1,27 +1,71 @@
-import json
+import os
+from typing import Optional
+
 import numpy as np
-from sklearn.cluster import KMeans
 
-def load_vec(embedding_json: str) -> np.ndarray:
-    return np.array(json.loads(embedding_json), dtype=np.float32)
+# Above this many rows KMeans switches to MiniBatchKMeans
+CLUSTER_MINIBATCH_ROWS = int(os.getenv("CLUSTER_MINIBATCH_ROWS", "5000"))
+# Stored clusters absorb new notes until they grow the corpus by this fraction...
+CLUSTER_REFIT_GROWTH = float(os.getenv("CLUSTER_REFIT_GROWTH", "0.2"))
+# ...or until new notes sit this many times further from their centroid than the fitted notes did
+CLUSTER_REFIT_DRIFT = float(os.getenv("CLUSTER_REFIT_DRIFT", "1.5"))
+
+def load_sklearn():
+    # sklearn (and scipy under it) take a noticeable share of startup, so they load on first use
+    from sklearn.cluster import KMeans, MiniBatchKMeans
 
-def kmeans_clusters(vectors: np.ndarray, k: int, seed: int = 42):
-    km = KMeans(n_clusters=k, random_state=seed, n_init=10)
+    return KMeans, MiniBatchKMeans
+
+def kmeans_clusters(vectors: np.ndarray, k: int, seed: int = 42, n_init: int = 10):
+    KMeans, MiniBatchKMeans = load_sklearn()
+    if len(vectors) > CLUSTER_MINIBATCH_ROWS:
+        km = MiniBatchKMeans(n_clusters=k, random_state=seed, n_init=min(n_init, 3), batch_size=1024)
+    else:
+        km = KMeans(n_clusters=k, random_state=seed, n_init=n_init)
     labels = km.fit_predict(vectors)
     centers = km.cluster_centers_
     return labels, centers
 
-def top_keywords(texts: list[str], top_n: int = 5) -> list[str]:
-    # Simple TF-IDF keywords
-    from sklearn.feature_extraction.text import TfidfVectorizer
-
-    vec = TfidfVectorizer(
-        stop_words="english",
-        max_features=2000,
-        ngram_range=(1, 2),
-    )
-    X = vec.fit_transform(texts)
-    scores = np.asarray(X.mean(axis=0)).ravel()
-    terms = np.array(vec.get_feature_names_out())
-    top_idx = scores.argsort()[::-1][:top_n]
-    return terms[top_idx].tolist()
+def assign_clusters(vectors: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    # nearest centroid by squared euclidean distance, as KMeans.predict does
+    d = (vectors ** 2).sum(axis=1)[:, None] - 2 * vectors @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+    return np.argmin(d, axis=1)
+
+def mean_sq_distance(vectors: np.ndarray, labels: np.ndarray, centers: np.ndarray) -> float:
+    if not len(vectors):
+        return 0.0
+    return float(((vectors - centers[labels]) ** 2).sum(axis=1).mean())
+
+def needs_refit(fitted_count: int, fitted_spread: float, new_count: int, new_spread: float) -> bool:
+    if fitted_count == 0 or new_count / fitted_count > CLUSTER_REFIT_GROWTH:
+        return True
+    return fitted_spread > 0 and new_spread / fitted_spread > CLUSTER_REFIT_DRIFT
+
+def incremental_labels(
+    ids: np.ndarray,
+    vectors: np.ndarray,
+    stored_ids: np.ndarray,
+    stored_labels: np.ndarray,
+    centers: np.ndarray,
+    fitted_count: int,
+    fitted_spread: float,
+) -> Optional[tuple[np.ndarray, np.ndarray]]:
+    """Labels for ids from a stored fit, or None when the notes added since the fit call for a refit.
+
+    stored_ids lists the fitted notes first, then the notes assigned since. Known
+    notes keep their label and new ones join the nearest centroid; growth and
+    drift are judged over everything assigned since the fit, not just this call.
+    Returns (labels, order), where ids[order] puts the fitted notes first again.
+    """
+    sorter = np.argsort(stored_ids)
+    pos = np.minimum(np.searchsorted(stored_ids, ids, sorter=sorter), len(stored_ids) - 1)
+    known = stored_ids[sorter][pos] == ids
+    labels = np.empty(len(ids), dtype=np.int32)
+    labels[known] = stored_labels[sorter][pos[known]]
+    labels[~known] = assign_clusters(vectors[~known], centers)
+
+    since = ~np.isin(ids, stored_ids[:fitted_count])
+    spread = mean_sq_distance(vectors[since], labels[since], centers)
+    if needs_refit(fitted_count, fitted_spread, int(since.sum()), spread):
+        return None
+    return labels, np.concatenate([np.flatnonzero(~since), np.flatnonzero(since)])
@@ -1,5 +1,6 @@
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 def _normalize_database_url(url: str) -> str:
@@ -13,8 +14,31 @@ def _normalize_database_url(url: str) -> str:
         url = url.replace("postgresql://", "postgresql+psycopg://", 1)
     return url
 
+def _async_database_url(url: str) -> str:
+    """
+    psycopg 3 serves both engines under 'postgresql+psycopg';
+    SQLite needs the aiosqlite driver for the async engine.
+    """
+    if url.startswith("sqlite://"):
+        url = url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
 DATABASE_URL = _normalize_database_url(DATABASE_URL)
+ASYNC_DATABASE_URL = _async_database_url(DATABASE_URL)
+
+# Request handlers use the async engine; the sync engine serves background
+# workers, migrations and cold index builds. Each gets its own pool of this size.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Opt-in: store vectors in a pgvector column (migration 0f6a2d8c4b17) and rank in Postgres.
+# The in-memory numpy index stays the path for SQLite and for Postgres without the extension.
+USE_PGVECTOR = os.getenv("USE_PGVECTOR", "0").lower() in ("1", "true", "yes")
+PGVECTOR_ENABLED = USE_PGVECTOR and DATABASE_URL.startswith("postgresql")
+# pgvector columns and HNSW indexes have a fixed dimension; all-MiniLM-L6-v2 is 384
+PGVECTOR_DIM = int(os.getenv("PGVECTOR_DIM", "384"))
 
 connect_args = {}
 if DATABASE_URL.startswith("sqlite"):
@@ -23,8 +47,9 @@ if DATABASE_URL.startswith("sqlite"):
 engine = create_engine(
     DATABASE_URL,
     pool_pre_ping=True,
-    pool_size=2,
-    max_overflow=0,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
 )
 
 SessionLocal = sessionmaker(
@@ -34,4 +59,18 @@ SessionLocal = sessionmaker(
     expire_on_commit=False,
 )
 
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 Base = declarative_base()
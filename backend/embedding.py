@@ -1,16 +1,250 @@
-import json
+import os
+import platform
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
 from functools import lru_cache
-from sentence_transformers import SentenceTransformer
+from typing import TYPE_CHECKING, Callable, Optional
 
-MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+import numpy as np
 
-@lru_cache(maxsize=1)
-def get_model() -> SentenceTransformer:
-    # loads once per server run
-    return SentenceTransformer(MODEL_NAME)
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
 
-def embed_text(text: str) -> tuple[str, str]:
-    model = get_model()
-    vec = model.encode([text], normalize_embeddings=True)[0]
-    embedding_json = json.dumps(vec.tolist())
-    return MODEL_NAME, embedding_json
+# Model new vectors should come from. When it differs from the active model recorded in
+# the database, `python -m reembed` fills its vectors and then switches search over.
+MODEL_NAME = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+# torch (fp32), torch-int8 (dynamically quantized Linear layers), onnx, or onnx-int8
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+# Quantized ONNX weights to load for onnx-int8; the model repo ships variants per CPU family
+EMBED_ONNX_INT8_FILE = os.getenv(
+    "EMBED_ONNX_INT8_FILE",
+    "onnx/model_qint8_arm64.onnx" if platform.machine().lower() in ("arm64", "aarch64") else "onnx/model_quint8_avx2.onnx",
+)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Unix socket of a shared `python inference.py` process; when set, this process loads no model
+EMBED_SERVER = os.getenv("EMBED_SERVER")
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+# How long a process keeps its cached active model name; a switch reaches every process within this
+ACTIVE_MODEL_TTL_SECONDS = float(os.getenv("ACTIVE_MODEL_TTL_SECONDS", "5"))
+ACTIVE_MODEL_SETTING = "embedding_model"
+
+def _load_torch(model: str) -> "SentenceTransformer":
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model)
+
+def _load_torch_int8(model: str) -> "SentenceTransformer":
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    # int8 weights with activations quantized on the fly; CPU only
+    st = SentenceTransformer(model, device="cpu")
+    return torch.quantization.quantize_dynamic(st, {torch.nn.Linear}, dtype=torch.qint8)
+
+def _load_onnx(model: str, file_name: Optional[str] = None) -> "SentenceTransformer":
+    from sentence_transformers import SentenceTransformer
+
+    model_kwargs = {"file_name": file_name} if file_name else None
+    try:
+        return SentenceTransformer(model, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+    except ImportError as e:
+        raise RuntimeError("the onnx embedding backends need `pip install sentence-transformers[onnx]`") from e
+
+EMBED_BACKENDS: dict[str, Callable[[str], "SentenceTransformer"]] = {
+    "torch": _load_torch,
+    "torch-int8": _load_torch_int8,
+    "onnx": _load_onnx,
+    "onnx-int8": lambda model: _load_onnx(model, EMBED_ONNX_INT8_FILE),
+}
+
+if EMBED_BACKEND not in EMBED_BACKENDS:
+    raise RuntimeError(f"EMBED_BACKEND must be one of {', '.join(EMBED_BACKENDS)}, not {EMBED_BACKEND!r}")
+
+def backend_model_name(backend: str, model: str = MODEL_NAME) -> str:
+    # Vectors from different backends are close but not identical, so each gets its own
+    # model_name; torch keeps the bare name the existing rows were written with
+    return model if backend == "torch" else f"{model}@{backend}"
+
+def split_model_name(model_name: str) -> tuple[str, str]:
+    """Inverse of backend_model_name: (backend, model)."""
+    model, _, backend = model_name.partition("@")
+    backend = backend or "torch"
+    if backend not in EMBED_BACKENDS:
+        raise RuntimeError(f"unknown embedding backend {backend!r} in model name {model_name!r}")
+    return backend, model
+
+def load_model(backend: str = EMBED_BACKEND, model: str = MODEL_NAME) -> "SentenceTransformer":
+    """Load a fresh model for the given backend; serving code should use get_model instead."""
+    return EMBED_BACKENDS[backend](model)
+
+_model_lock = threading.Lock()
+
+# Room for the active model and the one a re-embed is moving to
+@lru_cache(maxsize=4)
+def _load_model(model_name: str) -> "SentenceTransformer":
+    if EMBED_SERVER:
+        from inference import RemoteModel
+
+        return RemoteModel(EMBED_SERVER, model_name)
+    # torch / onnxruntime are only imported here, not when the app starts
+    return load_model(*split_model_name(model_name))
+
+def get_model(model_name: Optional[str] = None) -> "SentenceTransformer":
+    # loads once per server run, even when the warmup thread, the worker and a request ask at once
+    with _model_lock:
+        return _load_model(model_name or get_model_name())
+
+def configured_model_name() -> str:
+    # name of the model this deployment is configured to embed with
+    return backend_model_name(EMBED_BACKEND)
+
+
+class ActiveModel:
+    """The model_name that search reads and new notes are written under, shared by all processes.
+
+    It lives in app_settings, so a re-embed can switch every process at once;
+    until something records it, the first process to look pins the configured
+    model. Reads are cached for ACTIVE_MODEL_TTL_SECONDS and refreshed in the
+    background, so request threads never wait on the database for it.
+    """
+
+    def __init__(self, ttl_seconds: float = ACTIVE_MODEL_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._name: Optional[str] = None
+        self._expires = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def get(self) -> str:
+        with self._lock:
+            name, stale = self._name, time.monotonic() >= self._expires
+            refresh = name is not None and stale and not self._refreshing
+            if refresh:
+                self._refreshing = True
+        if name is None:
+            return self.refresh()
+        if refresh:
+            threading.Thread(target=self.refresh, name="active-model-refresh", daemon=True).start()
+        return name
+
+    def refresh(self) -> str:
+        # Imported here: embedding is used by processes that never open the database
+        from sqlalchemy.exc import IntegrityError
+
+        from db import SessionLocal
+        from models import AppSetting
+
+        try:
+            with SessionLocal() as db:
+                setting = db.get(AppSetting, ACTIVE_MODEL_SETTING)
+                if setting is None:
+                    setting = AppSetting(key=ACTIVE_MODEL_SETTING, value=configured_model_name())
+                    db.add(setting)
+                    try:
+                        db.commit()
+                    except IntegrityError:
+                        db.rollback()  # another process pinned it first
+                        setting = db.get(AppSetting, ACTIVE_MODEL_SETTING)
+                name = setting.value
+        finally:
+            with self._lock:
+                self._refreshing = False
+        with self._lock:
+            self._name, self._expires = name, time.monotonic() + self.ttl_seconds
+        return name
+
+    def set(self, db, model_name: str) -> None:
+        """Switch the active model inside the caller's transaction."""
+        from models import AppSetting
+
+        db.merge(AppSetting(key=ACTIVE_MODEL_SETTING, value=model_name))
+        with self._lock:
+            self._expires = 0.0  # re-read once the caller has committed
+
+
+active_model = ActiveModel()
+
+def get_model_name() -> str:
+    # name recorded on NoteEmbedding rows and searched; no model load or inference needed
+    return active_model.get()
+
+def embed_text(text: str, model_name: Optional[str] = None) -> tuple[str, np.ndarray]:
+    model_name, vecs = embed_texts([text], model_name=model_name)
+    return model_name, vecs[0]
+
+def embed_texts(
+    texts: list[str], batch_size: int = EMBED_BATCH_SIZE, model_name: Optional[str] = None
+) -> tuple[str, np.ndarray]:
+    """Encode many texts in one call with the active model (or model_name); returns an (n, dim) float32 matrix."""
+    model_name = model_name or get_model_name()
+    vecs = get_model(model_name).encode(texts, batch_size=batch_size, normalize_embeddings=True)
+    return model_name, np.asarray(vecs, dtype=np.float32)
+
+class QueryCache:
+    """Bounded LRU of query vectors keyed by (model_name, normalized text), with TTL expiry."""
+
+    def __init__(self, max_entries: int = QUERY_CACHE_SIZE, ttl_seconds: float = QUERY_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple[str, str], tuple[float, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple[str, str]) -> Optional[np.ndarray]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple[str, str], vec: np.ndarray) -> None:
+        vec.flags.writeable = False  # shared between requests
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, vec)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+query_cache = QueryCache()
+
+def normalize_query(text: str) -> str:
+    return unicodedata.normalize("NFC", " ".join(text.split()))
+
+def embed_query(text: str) -> tuple[str, np.ndarray]:
+    """Like embed_text, but served from query_cache for repeated search strings."""
+    key = (get_model_name(), normalize_query(text))
+    vec = query_cache.get(key)
+    if vec is None:
+        _, vec = embed_text(key[1], model_name=key[0])
+        query_cache.put(key, vec)
+    return key[0], vec
+
+def embed_queries(texts: list[str]) -> tuple[str, np.ndarray]:
+    """embed_query for many strings: cached ones are reused, the rest are encoded in one call."""
+    model_name = get_model_name()
+    keys = [(model_name, normalize_query(text)) for text in texts]
+    vecs = [query_cache.get(key) for key in keys]
+    missing = list(dict.fromkeys(key[1] for key, vec in zip(keys, vecs) if vec is None))
+    if missing:
+        _, encoded = embed_texts(missing, model_name=model_name)
+        fresh = dict(zip(missing, encoded))
+        for text, vec in fresh.items():
+            query_cache.put((model_name, text), vec)
+        vecs = [fresh[key[1]] if vec is None else vec for key, vec in zip(keys, vecs)]
+    return model_name, np.vstack(vecs)
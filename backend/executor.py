@@ -0,0 +1,21 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+# numpy, scikit-learn and torch release the GIL in their kernels, so a thread
+# pool keeps model inference and scoring off the event loop without copying the
+# in-memory indexes into other processes.
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 2)))
+
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+
+async def run_cpu(fn: Callable[..., T], *args, **kwargs) -> T:
+    loop = asyncio.get_running_loop()
+    # Carry the caller's context over, so request timing spans recorded in the pool are kept
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(cpu_executor, partial(ctx.run, fn, *args, **kwargs))
@@ -0,0 +1,68 @@
+import base64
+from typing import Optional
+
+import numpy as np
+
+from vectors import VEC_DTYPE, from_blob, load_vec
+
+# Rows fetched per round trip while streaming; export memory stays bounded by this
+EXPORT_YIELD_PER = 500
+# NDJSON lines joined into one chunk of the streamed response
+EXPORT_LINES_PER_CHUNK = 200
+VECTOR_FORMATS = ("none", "base64")
+
+def book_record(row) -> dict:
+    return {
+        "type": "book",
+        "id": row.id,
+        "title": row.title,
+        "author": row.author,
+        "created_at": row.created_at.isoformat(),
+    }
+
+def note_record(row, vectors: str) -> dict:
+    record = {
+        "type": "note",
+        "id": row.id,
+        "book_id": row.book_id,
+        "text": row.text,
+        "created_at": row.created_at.isoformat(),
+    }
+    if vectors == "base64" and row.model_name is not None:
+        vec = load_vec(row)
+        record["model_name"] = row.model_name
+        record["dtype"] = VEC_DTYPE
+        record["dim"] = int(vec.shape[0])
+        # Raw little-endian float32 bytes, the same layout as NoteEmbedding.embedding_blob
+        record["embedding"] = base64.b64encode(np.ascontiguousarray(vec, dtype=VEC_DTYPE).tobytes()).decode()
+    return record
+
+def record_vector(record: dict, model_name: str) -> Optional[np.ndarray]:
+    """The exported vector, if it came from the model we would embed with anyway.
+
+    Raises ValueError for an embedding that is present but not one /export/notes writes.
+    """
+    if record.get("model_name") != model_name or not record.get("embedding"):
+        return None
+    # Exports only write VEC_DTYPE; anything else is not ours to reinterpret
+    if record.get("dtype", VEC_DTYPE) != VEC_DTYPE:
+        raise ValueError(f"dtype must be {VEC_DTYPE!r}")
+    if not isinstance(record["embedding"], str):
+        raise ValueError("embedding must be a base64 string")
+    try:
+        blob = base64.b64decode(record["embedding"], validate=True)
+        return from_blob(blob, VEC_DTYPE, record.get("dim"))
+    except ValueError as e:
+        raise ValueError(f"invalid embedding: {e}") from None
+
+async def ndjson_lines(request):
+    """Yield the non-empty lines of a streamed request body without buffering all of it."""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
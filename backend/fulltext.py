@@ -0,0 +1,58 @@
+import re
+from typing import Optional
+
+from sqlalchemy import text
+
+# Full-text objects are created by migration e7b04d93a1c6 and are not mapped on
+# the ORM models: an FTS5 table (notes_fts) on SQLite, a generated tsvector
+# column with a GIN index (notes.text_tsv) on Postgres.
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_PHRASE = re.compile(r'"([^"]+)"')
+
+def fts5_query(q: str) -> str:
+    """Quoted phrases stay phrases; other words are OR'ed, so BM25 ranks partial matches too."""
+    parts = []
+    for phrase in _PHRASE.findall(q):
+        words = _TOKEN.findall(phrase)
+        if words:
+            parts.append('"' + " ".join(words) + '"')
+    parts.extend(f'"{word}"' for word in _TOKEN.findall(_PHRASE.sub(" ", q)))
+    return " OR ".join(parts)
+
+async def lexical_search(db, user_id: str, q: str, limit: int, book_id: Optional[int] = None) -> list[tuple[int, float]]:
+    """(note_id, score) pairs, best first. Empty on databases without a full-text index."""
+    dialect = db.bind.dialect.name
+    params = {"user_id": user_id, "limit": limit}
+    book_filter = ""
+    if book_id is not None:
+        book_filter = "AND notes.book_id = :book_id"
+        params["book_id"] = book_id
+
+    if dialect == "sqlite":
+        params["q"] = fts5_query(q)
+        if not params["q"]:
+            return []
+        # bm25() is lower-is-better, so it is negated into a score
+        stmt = text(f"""
+            SELECT notes.id, -bm25(notes_fts) AS score
+            FROM notes_fts JOIN notes ON notes.id = notes_fts.rowid
+            WHERE notes_fts MATCH :q AND notes.user_id = :user_id {book_filter}
+            ORDER BY bm25(notes_fts)
+            LIMIT :limit
+        """)
+    elif dialect == "postgresql":
+        # Postgres has no built-in BM25; ts_rank_cd is its closest ranking function
+        params["q"] = q
+        stmt = text(f"""
+            SELECT notes.id, ts_rank_cd(notes.text_tsv, query) AS score
+            FROM notes, websearch_to_tsquery('english', :q) AS query
+            WHERE notes.text_tsv @@ query AND notes.user_id = :user_id {book_filter}
+            ORDER BY score DESC
+            LIMIT :limit
+        """)
+    else:
+        return []
+
+    rows = (await db.execute(stmt, params)).all()
+    return [(int(note_id), float(score)) for note_id, score in rows]
@@ -0,0 +1,289 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+import numpy as np
+from sqlalchemy import select
+
+from ann import ANN_DEFAULT_NPROBE, ANN_MIN_ROWS, IVFIndex
+from models import Note, NoteEmbedding
+from quant import QUANT_INT8, QUANT_MIN_ROWS, QUANT_RERANK, QuantizedMatrix
+from vectors import load_vec
+
+INDEX_CACHE_USERS = int(os.getenv("INDEX_CACHE_USERS", "64"))
+
+NO_BOOK = -1  # book_ids sentinel for notes without a book
+
+
+class UserIndex:
+    """Contiguous float32 matrix of one user's note vectors, plus parallel id arrays.
+
+    Rows are only ever appended, so a reader that snapshots (matrix, size) can
+    score without holding the lock while writers fill rows past its size.
+    """
+
+    def __init__(self, dim: int, capacity: int = 256):
+        self.dim = dim
+        self._matrix = np.empty((capacity, dim), dtype=np.float32)
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._book_ids = np.empty(capacity, dtype=np.int64)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._ivf: Optional[IVFIndex] = None
+        self._ivf_lock = threading.Lock()
+        self._quant: Optional[QuantizedMatrix] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def snapshot(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        with self._lock:
+            n = self._size
+            return self._matrix[:n], self._ids[:n], self._book_ids[:n]
+
+    def _grow(self, needed: int) -> None:
+        capacity = max(needed, 2 * self._matrix.shape[0])
+        matrix = np.empty((capacity, self.dim), dtype=np.float32)
+        ids = np.empty(capacity, dtype=np.int64)
+        book_ids = np.empty(capacity, dtype=np.int64)
+        n = self._size
+        matrix[:n] = self._matrix[:n]
+        ids[:n] = self._ids[:n]
+        book_ids[:n] = self._book_ids[:n]
+        self._matrix, self._ids, self._book_ids = matrix, ids, book_ids
+
+    def add_many(self, note_ids, book_ids, vecs: np.ndarray) -> None:
+        note_ids = np.asarray(note_ids, dtype=np.int64)
+        book_ids = np.asarray([NO_BOOK if b is None else b for b in book_ids], dtype=np.int64)
+        vecs = np.asarray(vecs, dtype=np.float32)
+        vecs = vecs.reshape(-1, vecs.shape[-1])
+        with self._lock:
+            if vecs.shape[1] != self.dim:
+                if self._size:
+                    raise ValueError(f"vector dim {vecs.shape[1]} does not match index dim {self.dim}")
+                self.dim = vecs.shape[1]
+                self._matrix = np.empty((self._matrix.shape[0], self.dim), dtype=np.float32)
+            fresh = ~np.isin(note_ids, self._ids[:self._size])
+            if not fresh.any():
+                return
+            note_ids, book_ids, vecs = note_ids[fresh], book_ids[fresh], vecs[fresh]
+            n, m = self._size, len(note_ids)
+            if n + m > self._matrix.shape[0]:
+                self._grow(n + m)
+            self._matrix[n:n + m] = vecs
+            self._ids[n:n + m] = note_ids
+            self._book_ids[n:n + m] = book_ids
+            self._size = n + m
+
+    def add(self, note_id: int, book_id: Optional[int], vec: np.ndarray) -> None:
+        self.add_many([note_id], [book_id], vec)
+
+    def ivf(self, matrix: np.ndarray) -> IVFIndex:
+        """IVF over the given snapshot, refit once it has outgrown its training size."""
+        with self._ivf_lock:
+            ivf = self._ivf
+            if ivf is None or ivf.needs_rebuild(matrix.shape[0]):
+                ivf = IVFIndex.build(matrix)
+            else:
+                ivf = ivf.extend(matrix)
+            self._ivf = ivf
+            return ivf
+
+    def quantized(self, matrix: np.ndarray) -> QuantizedMatrix:
+        """int8 copy of the given snapshot, extended as rows are appended."""
+        with self._ivf_lock:
+            quant = self._quant
+            if quant is None or quant.dim != matrix.shape[1]:
+                quant = self._quant = QuantizedMatrix(matrix.shape[1], capacity=max(256, matrix.shape[0]))
+        return quant.extend(matrix)
+
+    def search(
+        self,
+        q_vec: np.ndarray,
+        k: int,
+        book_id: Optional[int] = None,
+        mode: str = "exact",
+        nprobe: int = ANN_DEFAULT_NPROBE,
+        quantized: Optional[bool] = None,
+        approx_min_rows: int = ANN_MIN_ROWS,
+    ) -> list[tuple[int, float]]:
+        """Top-k notes by cosine.
+
+        `quantized` forces the int8 first pass on or off; left as None it follows
+        QUANT_INT8 and only kicks in from QUANT_MIN_ROWS. Approx mode scans exactly
+        below `approx_min_rows`; pass 0 to always probe the IVF (e.g. to measure it).
+        """
+        matrix, ids, book_ids = self.snapshot()
+        if not len(ids):
+            return []
+        q_vec = np.asarray(q_vec, dtype=np.float32)
+
+        rows = None
+        # Small libraries are cheaper to scan than to probe
+        if mode == "approx" and len(ids) >= approx_min_rows:
+            rows = self.ivf(matrix).candidates(q_vec, nprobe)
+            if not len(rows):
+                return []
+
+        if quantized is None:
+            quantized = QUANT_INT8 and len(ids) >= QUANT_MIN_ROWS
+        if quantized:
+            # Cheap pass over the int8 copy, then full-precision scores for the best few
+            scores = self.quantized(matrix).scores(q_vec, len(ids), rows)
+            if rows is None:
+                rows = np.arange(len(ids))
+            if book_id is not None:
+                scores = np.where(book_ids[rows] == book_id, scores, -np.inf)
+            n = min(len(rows), k * QUANT_RERANK)
+            best = np.argpartition(-scores, n - 1)[:n] if n < len(rows) else np.arange(len(rows))
+            rows = rows[best[np.isfinite(scores[best])]]
+
+        if rows is not None:
+            matrix, ids, book_ids = matrix[rows], ids[rows], book_ids[rows]
+            if not len(ids):
+                return []
+        scores = matrix @ q_vec
+        if book_id is not None:
+            scores = np.where(book_ids == book_id, scores, -np.inf)
+        return top_k(scores, ids, k)
+
+    def search_many(self, q_vecs: np.ndarray, k: int, book_id: Optional[int] = None) -> list[list[tuple[int, float]]]:
+        """Exact top-k for each row of q_vecs, scored with one matrix-matrix product."""
+        matrix, ids, book_ids = self.snapshot()
+        if not len(ids):
+            return [[] for _ in range(len(q_vecs))]
+        if book_id is not None:
+            rows = np.flatnonzero(book_ids == book_id)
+            matrix, ids = matrix[rows], ids[rows]
+        scores = np.asarray(q_vecs, dtype=np.float32) @ matrix.T  # (queries, notes)
+        return [top_k(row, ids, k) for row in scores]
+
+    def score_ids(self, q_vec: np.ndarray, note_ids, k: int) -> list[tuple[int, float]]:
+        """Top-k among just the given notes, e.g. candidates from a lexical prefilter."""
+        matrix, ids, _ = self.snapshot()
+        rows = np.flatnonzero(np.isin(ids, np.asarray(note_ids, dtype=np.int64)))
+        if not len(rows):
+            return []
+        return top_k(matrix[rows] @ np.asarray(q_vec, dtype=np.float32), ids[rows], k)
+
+
+def top_k(scores: np.ndarray, ids: np.ndarray, k: int) -> list[tuple[int, float]]:
+    k = min(k, len(scores))
+    idx = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    idx = idx[np.argsort(-scores[idx], kind="stable")]
+    return [(int(ids[i]), float(scores[i])) for i in idx if np.isfinite(scores[i])]
+
+
+class IndexCache:
+    """LRU of per-user indexes (UserIndex by (user_id, model_name), TermIndex by user_id)."""
+
+    def __init__(self, max_entries: int = INDEX_CACHE_USERS):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        # Adds that arrive while a key is being built are replayed onto the new index
+        self._building: dict[Hashable, list] = {}
+        self._build_locks: dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            index = self._entries.get(key)
+            if index is not None:
+                self._entries.move_to_end(key)
+            return index
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        index = self.get(key)
+        if index is not None:
+            return index
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            index = self.get(key)
+            if index is not None:
+                return index
+            with self._lock:
+                self._building[key] = []
+            try:
+                index = build()
+            except BaseException:
+                with self._lock:
+                    self._building.pop(key, None)
+                    self._build_locks.pop(key, None)
+                raise
+            # Published in the same step that stops queueing, so an add in between
+            # reaches either the pending list or the cached index
+            with self._lock:
+                self._insert(key, index)
+                pending = self._building.pop(key, [])
+                self._build_locks.pop(key, None)
+            for args in pending:
+                index.add_many(*args)
+            return index
+
+    def put(self, key: Hashable, index: Any) -> None:
+        with self._lock:
+            self._insert(key, index)
+
+    def _insert(self, key: Hashable, index: Any) -> None:
+        self._entries[key] = index
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def add(self, key: Hashable, note_id: int, book_id: Optional[int], vec: np.ndarray) -> None:
+        self.add_many(key, [note_id], [book_id], vec)
+
+    def add_many(self, key: Hashable, *args) -> None:
+        """Forward to the cached index's add_many; a no-op for keys that are not cached."""
+        # Users without a cached index pick the notes up from the DB on their next build
+        with self._lock:
+            index = self._entries.get(key)
+            if index is None:
+                if key in self._building:
+                    self._building[key].append(args)
+                return
+        index.add_many(*args)
+
+    def evict(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+def load_user_index(db, user_id: str, model_name: str) -> UserIndex:
+    stmt = (
+        select(
+            Note.id,
+            Note.book_id,
+            NoteEmbedding.embedding_blob,
+            NoteEmbedding.embedding_dtype,
+            NoteEmbedding.embedding_dim,
+            NoteEmbedding.embedding_json,
+        )
+        .join(NoteEmbedding, NoteEmbedding.note_id == Note.id)
+        .where(Note.user_id == user_id)
+        .where(NoteEmbedding.model_name == model_name)
+        .order_by(Note.id)
+    )
+    rows = db.execute(stmt).all()
+    vecs = [load_vec(row) for row in rows]
+    dim = vecs[0].shape[0] if vecs else 384
+    index = UserIndex(dim, capacity=max(256, len(rows)))
+    if rows:
+        index.add_many([row.id for row in rows], [row.book_id for row in rows], np.vstack(vecs))
+    return index
+
+
+
+if os.getenv("VECTOR_STORE_DIR"):
+    # Multi-process deployments share one mapped copy of each user's vectors
+    from vecstore import VECTOR_STORE_DIR, MappedIndexCache
+
+    vector_index = MappedIndexCache(VECTOR_STORE_DIR)
+else:
+    vector_index = IndexCache()
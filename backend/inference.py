@@ -0,0 +1,180 @@
+"""One process holding the embedding model for every web and queue worker on the host.
+
+    EMBED_SERVER=/tmp/reading-notes-embed.sock EMBED_SERVER_AUTHKEY=<secret> python inference.py
+
+Clients (get_model with EMBED_SERVER set) send encode requests naming a model
+over a unix socket; concurrent requests for the same model are coalesced into
+one batch. The configured model is loaded at start, others (e.g. the target
+of a re-embed) on first use.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Optional
+
+import numpy as np
+
+from embedding import EMBED_BATCH_SIZE, EMBED_SERVER, configured_model_name, load_model, split_model_name
+from logs import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Shared secret for the connection handshake. Messages are pickled, so anyone holding the
+# key can run code in the server; there is deliberately no default (start.sh generates one).
+EMBED_SERVER_AUTHKEY = os.getenv("EMBED_SERVER_AUTHKEY", "").encode()
+# How long clients keep retrying while the server is still starting
+EMBED_SERVER_CONNECT_SECONDS = float(os.getenv("EMBED_SERVER_CONNECT_SECONDS", "60"))
+
+
+class RemoteModel:
+    """Stands in for one SentenceTransformer, forwarding encode() to the inference server.
+
+    Connections are not thread-safe, so each thread keeps its own.
+    """
+
+    def __init__(self, address: str, model_name: str):
+        if not EMBED_SERVER_AUTHKEY:
+            raise RuntimeError("EMBED_SERVER needs EMBED_SERVER_AUTHKEY, the same secret the inference server uses")
+        self.address = address
+        self.model_name = model_name
+        self._local = threading.local()
+
+    def _connect(self) -> Connection:
+        deadline = time.monotonic() + EMBED_SERVER_CONNECT_SECONDS
+        while True:
+            try:
+                conn = Client(self.address, family="AF_UNIX", authkey=EMBED_SERVER_AUTHKEY)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.5)
+        return conn
+
+    def _call(self, request: tuple):
+        for attempt in range(2):
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = self._local.conn = self._connect()
+            try:
+                conn.send(request)
+                ok, payload = conn.recv()
+                break
+            except (EOFError, OSError):
+                # Server restarted: reconnect once
+                self._local.conn = None
+                if attempt:
+                    raise
+        if not ok:
+            raise RuntimeError(f"inference server: {payload}")
+        return payload
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._call(("info", self.model_name))["dim"]
+
+    def encode(self, texts, batch_size: int = EMBED_BATCH_SIZE, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        return self._call(("encode", self.model_name, list(texts), bool(normalize_embeddings)))
+
+
+class InferenceServer:
+    """Accepts clients on a unix socket and runs their encodes, batching across clients."""
+
+    def __init__(self, address: str, model_name: Optional[str] = None, batch_size: int = EMBED_BATCH_SIZE):
+        self.address = address
+        self.model_name = model_name or configured_model_name()
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[tuple[str, list[str], bool, Future]]" = queue.Queue()
+        self._models: dict = {}
+        self._models_lock = threading.Lock()
+
+    def _model(self, model_name: str):
+        with self._models_lock:
+            model = self._models.get(model_name)
+            if model is None:
+                logger.info("loading %s", model_name)
+                model = self._models[model_name] = load_model(*split_model_name(model_name))
+            return model
+
+    def serve_forever(self) -> None:
+        self._model(self.model_name)
+        threading.Thread(target=self._run_batches, name="inference-batches", daemon=True).start()
+
+        if os.path.exists(self.address):
+            os.unlink(self.address)  # left over from a previous run
+        with Listener(self.address, family="AF_UNIX", authkey=EMBED_SERVER_AUTHKEY) as listener:
+            os.chmod(self.address, 0o600)
+            logger.info("serving %s on %s", self.model_name, self.address)
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception:
+                    logger.warning("rejected inference client", exc_info=True)
+                    continue
+                threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+
+    def _serve_client(self, conn: Connection) -> None:
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if request[0] == "info":
+                        conn.send((True, {"dim": self._model(request[1]).get_sentence_embedding_dimension()}))
+                        continue
+                    _, model_name, texts, normalize = request
+                    future: Future = Future()
+                    self._queue.put((model_name, texts, normalize, future))
+                    conn.send((True, future.result()))
+                except Exception as e:
+                    conn.send((False, repr(e)))
+
+    def _run_batches(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            n = len(batch[0][1])
+            # Coalesce whatever else is waiting, up to one model batch
+            while n < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+                n += len(item[1])
+            groups: dict[tuple[str, bool], list] = {}
+            for item in batch:
+                groups.setdefault((item[0], item[2]), []).append(item)
+            for (model_name, normalize), group in groups.items():
+                self._encode(model_name, group, normalize)
+
+    def _encode(self, model_name: str, group: list, normalize: bool) -> None:
+        texts = [text for item in group for text in item[1]]
+        try:
+            model = self._model(model_name)
+            vecs = np.asarray(
+                model.encode(texts, batch_size=self.batch_size, normalize_embeddings=normalize), dtype=np.float32
+            )
+        except Exception as e:
+            for *_, future in group:
+                future.set_exception(e)
+            return
+        start = 0
+        for _, item_texts, _, future in group:
+            future.set_result(vecs[start:start + len(item_texts)])
+            start += len(item_texts)
+
+
+if __name__ == "__main__":
+    configure_logging()
+    if not EMBED_SERVER:
+        raise SystemExit("set EMBED_SERVER to the unix socket path to listen on")
+    if not EMBED_SERVER_AUTHKEY:
+        raise SystemExit("set EMBED_SERVER_AUTHKEY to a random secret shared with the clients")
+    InferenceServer(EMBED_SERVER).serve_forever()
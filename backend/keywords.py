@@ -0,0 +1,92 @@
+import threading
+from functools import lru_cache
+
+import numpy as np
+from sqlalchemy import select
+
+from index import IndexCache
+from models import Note
+
+@lru_cache(maxsize=1)
+def analyzer():
+    # Same tokenization the per-cluster TfidfVectorizer used: English stop words, 1-2 grams.
+    # Built on first use so importing this module does not import sklearn.
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    return CountVectorizer(stop_words="english", ngram_range=(1, 2)).build_analyzer()
+
+
+class TermIndex:
+    """One user's sparse term-document counts, grown incrementally as notes arrive.
+
+    Each note is stored as a (term ids, counts) row; document frequencies are
+    kept for the whole corpus so cluster keywords are scored with corpus-wide IDF.
+    """
+
+    def __init__(self):
+        self.vocab: dict[str, int] = {}
+        self.terms: list[str] = []
+        self._df = np.zeros(1024, dtype=np.int64)
+        self._rows: dict[int, tuple[np.ndarray, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add_many(self, note_ids, texts) -> None:
+        analyze = analyzer()
+        with self._lock:
+            for note_id, text in zip(note_ids, texts):
+                if note_id in self._rows:
+                    continue
+                counts: dict[int, int] = {}
+                for term in analyze(text):
+                    term_id = self.vocab.get(term)
+                    if term_id is None:
+                        term_id = self.vocab[term] = len(self.terms)
+                        self.terms.append(term)
+                    counts[term_id] = counts.get(term_id, 0) + 1
+                term_ids = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+                if len(self.terms) > len(self._df):
+                    # One long note can add more new terms than the array holds
+                    df = np.zeros(max(len(self.terms), 2 * len(self._df)), dtype=np.int64)
+                    df[:len(self._df)] = self._df
+                    self._df = df
+                self._df[term_ids] += 1
+                self._rows[note_id] = (term_ids, np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))
+
+    def keywords(self, note_ids, top_n: int = 5) -> list[str]:
+        """Terms with the highest mean L2-normalized TF-IDF over the given notes."""
+        with self._lock:
+            rows = [self._rows[i] for i in note_ids if i in self._rows]
+            n_docs = len(self._rows)
+            n_terms = len(self.terms)
+            df = self._df[:n_terms]
+        rows = [r for r in rows if len(r[0])]
+        if not rows:
+            return []
+
+        idf = np.log((1 + n_docs) / (1 + df)) + 1  # smooth_idf, as TfidfVectorizer
+        term_ids = np.concatenate([r[0] for r in rows])
+        weights = np.concatenate([r[1] for r in rows]) * idf[term_ids]
+        starts = np.cumsum([0] + [len(r[0]) for r in rows[:-1]])
+        norms = np.sqrt(np.add.reduceat(weights ** 2, starts))
+        weights /= np.repeat(norms, [len(r[0]) for r in rows])
+
+        scores = np.bincount(term_ids, weights=weights, minlength=n_terms) / len(rows)
+        top_n = min(top_n, int((scores > 0).sum()))
+        if top_n == 0:
+            return []
+        top_idx = np.argpartition(-scores, top_n - 1)[:top_n]
+        top_idx = top_idx[np.argsort(-scores[top_idx], kind="stable")]
+        return [self.terms[i] for i in top_idx]
+
+
+def load_term_index(db, user_id: str) -> TermIndex:
+    index = TermIndex()
+    rows = db.execute(select(Note.id, Note.text).where(Note.user_id == user_id).order_by(Note.id)).all()
+    index.add_many([row.id for row in rows], [row.text for row in rows])
+    return index
+
+
+term_index = IndexCache()
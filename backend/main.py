@@ -1,29 +1,84 @@
-from datetime import datetime
+import json
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 from typing import List
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
-from sqlalchemy import select
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import and_, func, select, text
 
-from db import Base, engine, SessionLocal
-from models import Note, Book, NoteEmbedding
+from db import Base, engine, SessionLocal, AsyncSessionLocal, PGVECTOR_ENABLED
+from executor import run_cpu
+from models import Note, Book, NoteEmbedding, NoteNeighbors, ClusterResult
 from typing import Optional
-from embedding import embed_text
-from search import load_vec, cosine_sim
+from embedding import embed_texts, embed_queries, embed_query, get_model_name, query_cache
+from vectors import load_vec, embedding_fields
+from search import rrf_fuse
+from fulltext import lexical_search
+from pgsearch import backfill_vectors, pgvector_search
+from pagination import NEXT_CURSOR_HEADER, keyset_page, next_cursor
+from export import EXPORT_LINES_PER_CHUNK, EXPORT_YIELD_PER, VECTOR_FORMATS, book_record, ndjson_lines, note_record, record_vector
 import numpy as np
-from clusters import load_vec, kmeans_clusters, top_keywords
+from clusters import incremental_labels, kmeans_clusters, mean_sq_distance
+from keywords import TermIndex, load_term_index, term_index
+from index import vector_index, load_user_index
+from vecstore import VECTOR_STORE_DIR
+from worker import EMBED_WORKERS, embedding_status, embedding_worker, enqueue
+from ann import ANN_DEFAULT_NPROBE, recall_at_k
+from neighbors import RELATED_TOP_N, compute_neighbors, notes_added, unpack
+from reembed import REEMBED_BACKGROUND, reembedder
+from logs import configure_logging
+from metrics import TimedJSONResponse, TimingMiddleware, register_collector, render_metrics, span
+import time
 
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
 from fastapi import Depends
-from auth import get_current_user_id
+from auth import get_current_user_id, key_store
+from warmup import MODEL_PRELOAD, warmup
+import asyncio
 import os
-
-
-
-app = FastAPI(title="Reading AI Notes API", version="0.1.0")
+import threading
+
+logger = logging.getLogger(__name__)
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Prefetch signing keys so the first authenticated request does not wait on the network
+    key_store.start()
+    # Load the model off the request path; /ready turns 200 once it is warm
+    if MODEL_PRELOAD:
+        warmup.start()
+    # EMBED_WORKERS=0 leaves the queue to a standalone `python worker.py`
+    if EMBED_WORKERS > 0:
+        embedding_worker.start()
+    elif not VECTOR_STORE_DIR:
+        # The worker's vectors would only reach its own in-memory indexes, never this process's
+        raise RuntimeError("EMBED_WORKERS=0 needs VECTOR_STORE_DIR so a standalone worker's notes reach search")
+    # Vectors stored while USE_PGVECTOR was off have no pgvector column value yet
+    if PGVECTOR_ENABLED:
+        threading.Thread(target=backfill_vectors, name="pgvector-backfill", daemon=True).start()
+    # Moves notes to EMBED_MODEL when it differs from the active model; enable on one process only
+    if REEMBED_BACKGROUND:
+        reembedder.start()
+    yield
+    reembedder.stop()
+    embedding_worker.stop()
+    key_store.stop()
+
+app = FastAPI(
+    title="Reading AI Notes API",
+    version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=TimedJSONResponse,
+)
 cors_origins = os.getenv("CORS_ORIGINS", "http://localhost:5173").split(",")
-print("CORS_ORIGINS =", cors_origins)
+logger.info("CORS origins: %s", cors_origins, extra={"cors_origins": cors_origins})
 
 app.add_middleware(
     CORSMiddleware,
@@ -31,7 +86,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "Server-Timing"],
 )
+# Added last so it is outermost and times CORS handling too
+app.add_middleware(TimingMiddleware)
 # Base.metadata.create_all(bind=engine)
 
 class NoteCreate(BaseModel):
@@ -47,6 +105,39 @@ class NoteOut(BaseModel):
     class Config:
         from_attributes = True
 
+class EmbeddingStatusOut(BaseModel):
+    note_id: int
+    status: str
+    attempts: int = 0
+    error: Optional[str] = None
+
+class BulkNoteResult(BaseModel):
+    index: int
+    ok: bool
+    note: Optional[NoteOut] = None
+    error: Optional[str] = None
+
+class BulkNotesOut(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkNoteResult]
+
+BULK_MAX_NOTES = int(os.getenv("BULK_MAX_NOTES", "5000"))
+
+class ImportLineError(BaseModel):
+    line: int
+    error: str
+
+class ImportOut(BaseModel):
+    books_created: int = 0
+    notes_created: int = 0
+    embeddings_reused: int = 0
+    failed: int = 0
+    errors: List[ImportLineError] = []
+
+IMPORT_CHUNK = int(os.getenv("IMPORT_CHUNK", "500"))
+IMPORT_MAX_ERRORS = 100
+
 class BookCreate(BaseModel):
     title: str = Field(..., min_length=1, max_length=255)
     author: Optional[str] = Field(default=None, max_length=255)
@@ -64,6 +155,36 @@ class NoteSearchHit(BaseModel):
     note: NoteOut
     score: float
 
+class SearchRecallOut(BaseModel):
+    k: int
+    nprobe: int
+    samples: int
+    n_notes: int
+    n_lists: int
+    recall: float
+    exact_ms: float
+    approx_ms: float
+    # int8 first pass + float32 re-rank, measured against the float32 exact scan
+    int8_recall: float
+    int8_ms: float
+    float32_mb: float
+    int8_mb: float
+
+class BatchSearchIn(BaseModel):
+    queries: List[str]
+    k: int = 10
+    book_id: Optional[int] = None
+
+class BatchSearchOut(BaseModel):
+    query: str
+    hits: List[NoteSearchHit]
+
+BATCH_SEARCH_MAX_QUERIES = int(os.getenv("BATCH_SEARCH_MAX_QUERIES", "50"))
+
+SEARCH_MODES = ("exact", "approx", "hybrid")
+# Each side of a hybrid search contributes this many candidates to the fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "100"))
+
 class ClusterNote(BaseModel):
     note: NoteOut
     score: float  # similarity to cluster centroid
@@ -87,172 +208,797 @@ def echo_origin(request: Request):
 def health():
     return {"status": "ok", "service": "reading-ai-notes-backend"}
 
+READY_DB_TIMEOUT = 2.0
+
+async def _db_ok() -> bool:
+    try:
+        async with AsyncSessionLocal() as db:
+            await asyncio.wait_for(db.execute(text("SELECT 1")), READY_DB_TIMEOUT)
+        return True
+    except Exception:
+        logger.warning("readiness database check failed", exc_info=True)
+        return False
+
+@app.get("/ready")
+async def ready(response: Response):
+    """Readiness, as opposed to `/` liveness: 503 until the model is warm, signing keys are loaded and the DB answers."""
+    checks = {
+        # Without preload the model loads on first use, so it never holds readiness back
+        "model": warmup.ready.is_set() or not MODEL_PRELOAD,
+        "jwks": key_store.loaded,
+        "database": await _db_ok(),
+    }
+    is_ready = all(checks.values())
+    if not is_ready:
+        response.status_code = 503
+    out = {"status": "ready" if is_ready else "starting", "checks": checks}
+    if warmup.seconds is not None:
+        out["model_warmup_seconds"] = round(warmup.seconds, 2)
+    if warmup.error is not None:
+        out["model_error"] = warmup.error
+    return out
+
+def _cache_metrics():
+    stats = query_cache.stats()
+    return [
+        ("embedding_query_cache_hits_total", "counter", "Query embeddings served from the cache.", stats["hits"]),
+        ("embedding_query_cache_misses_total", "counter", "Query embeddings computed by the model.", stats["misses"]),
+        ("embedding_query_cache_entries", "gauge", "Query embeddings currently cached.", stats["size"]),
+        ("vector_index_cached_users", "gauge", "Per-user vector indexes held in memory.", len(vector_index)),
+        ("term_index_cached_users", "gauge", "Per-user term indexes held in memory.", len(term_index)),
+    ]
+
+register_collector(_cache_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics():
+    """Prometheus text exposition of request and stage latencies plus cache counters."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.post("/notes", response_model=NoteOut, status_code=201)
-def create_note(payload: NoteCreate, user_id: str = Depends(get_current_user_id)):
-    with SessionLocal() as db:
+async def create_note(payload: NoteCreate, user_id: str = Depends(get_current_user_id)):
+    async with span("db"), AsyncSessionLocal() as db:
         if payload.book_id is not None:
-            exists = db.get(Book, payload.book_id)
-            if exists is None:
+            exists = await db.get(Book, payload.book_id)
+            if exists is None or exists.user_id != user_id:
                 raise HTTPException(status_code=400, detail="book_id does not exist")
             
         note = Note(user_id=user_id, text=payload.text, book_id=payload.book_id)
         db.add(note)
-        db.commit()
-        db.refresh(note)
-
-        model_name, embedding_json = embed_text(note.text)
-        emb = NoteEmbedding(note_id=note.id, model_name=model_name, embedding_json=embedding_json)
-        db.add(emb)
-        db.commit()
-
-        return note
+        await db.flush()
+        # Embedding happens on the worker; the note and its job commit together
+        enqueue(db, note.id, get_model_name())
+        await db.commit()
+
+    embedding_worker.notify()
+    # Tokenizing is CPU work; keep it off the event loop
+    await run_cpu(term_index.add_many, user_id, [note.id], [note.text])
+    return note
+
+def _parse_bulk_items(body: bytes, content_type: str) -> list:
+    if "ndjson" in content_type or "jsonl" in content_type:
+        items = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                items.append(e)  # reported against this line's index
+        return items
+
+    try:
+        items = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="body must be a JSON array or NDJSON")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="body must be a JSON array of notes")
+    return items
+
+def _validation_message(e: ValidationError) -> str:
+    err = e.errors()[0]
+    loc = ".".join(str(part) for part in err["loc"])
+    return f"{loc}: {err['msg']}" if loc else err["msg"]
+
+async def _known_books(user_id: str, book_ids: set) -> set:
+    # One lookup for all distinct book ids rather than one per note; other users' books count as missing
+    if not book_ids:
+        return set()
+    async with AsyncSessionLocal() as db:
+        return set(await db.scalars(select(Book.id).where(Book.id.in_(book_ids)).where(Book.user_id == user_id)))
+
+async def _store_notes(
+    user_id: str,
+    payloads: List[NoteCreate],
+    vecs: Optional[list] = None,
+    created_ats: Optional[List[Optional[datetime]]] = None,
+) -> List[Note]:
+    """Insert notes and their embeddings in one transaction; None vectors are embedded in batches first."""
+    vecs = list(vecs) if vecs is not None else [None] * len(payloads)
+    model_name = get_model_name()
+    missing = [i for i, vec in enumerate(vecs) if vec is None]
+    if missing:
+        # Embed before opening the transaction so no connection is held during inference
+        with span("embed"):
+            model_name, embedded = await run_cpu(embed_texts, [payloads[i].text for i in missing])
+        for i, vec in zip(missing, embedded):
+            vecs[i] = vec
+
+    async with span("db"), AsyncSessionLocal() as db:
+        notes = [Note(user_id=user_id, text=p.text, book_id=p.book_id) for p in payloads]
+        for note, created_at in zip(notes, created_ats or []):
+            if created_at is not None:
+                note.created_at = created_at
+        db.add_all(notes)
+        await db.flush()
+        db.add_all([
+            NoteEmbedding(note_id=note.id, model_name=model_name, **embedding_fields(vec))
+            for note, vec in zip(notes, vecs)
+        ])
+        await db.commit()
+
+    # Off the event loop: appends may take file locks and write (VECTOR_STORE_DIR), and tokenizing is CPU work
+    await run_in_threadpool(
+        vector_index.add_many, (user_id, model_name), [n.id for n in notes], [n.book_id for n in notes], np.vstack(vecs)
+    )
+    await run_cpu(term_index.add_many, user_id, [n.id for n in notes], [n.text for n in notes])
+    await run_in_threadpool(notes_added, user_id, model_name, [n.id for n in notes])
+    return notes
+
+async def _import_notes(items: list, user_id: str) -> BulkNotesOut:
+    results: List[Optional[BulkNoteResult]] = [None] * len(items)
+
+    parsed = []
+    for i, item in enumerate(items):
+        if isinstance(item, Exception):
+            results[i] = BulkNoteResult(index=i, ok=False, error=f"invalid JSON: {item}")
+            continue
+        try:
+            parsed.append((i, NoteCreate.model_validate(item)))
+        except ValidationError as e:
+            results[i] = BulkNoteResult(index=i, ok=False, error=_validation_message(e))
+
+    known_books = await _known_books(user_id, {p.book_id for _, p in parsed if p.book_id is not None})
+
+    accepted = []
+    for i, p in parsed:
+        if p.book_id is not None and p.book_id not in known_books:
+            results[i] = BulkNoteResult(index=i, ok=False, error="book_id does not exist")
+        else:
+            accepted.append((i, p))
+
+    if accepted:
+        notes = await _store_notes(user_id, [p for _, p in accepted])
+        for (i, _), note in zip(accepted, notes):
+            results[i] = BulkNoteResult(index=i, ok=True, note=NoteOut.model_validate(note))
+
+    return BulkNotesOut(created=len(accepted), failed=len(items) - len(accepted), results=results)
+
+@app.post("/notes/bulk", response_model=BulkNotesOut)
+async def create_notes_bulk(request: Request, user_id: str = Depends(get_current_user_id)):
+    """Import a JSON array or NDJSON stream of notes in one transaction, embedding in batches."""
+    items = _parse_bulk_items(await request.body(), request.headers.get("content-type", ""))
+    if not items:
+        raise HTTPException(status_code=400, detail="no notes to import")
+    if len(items) > BULK_MAX_NOTES:
+        raise HTTPException(status_code=400, detail=f"at most {BULK_MAX_NOTES} notes per request")
+    return await _import_notes(items, user_id)
+
+@app.get("/export/notes")
+async def export_notes(vectors: str = "none", user_id: str = Depends(get_current_user_id)):
+    """Stream the user's books then notes as NDJSON, optionally with base64 float32 vectors."""
+    if vectors not in VECTOR_FORMATS:
+        raise HTTPException(status_code=400, detail=f"vectors must be one of {', '.join(VECTOR_FORMATS)}")
+    model_name = get_model_name()
+
+    async def records():
+        lines = []
+        async with AsyncSessionLocal() as db:
+            books = (
+                select(Book.id, Book.title, Book.author, Book.created_at)
+                .where(Book.user_id == user_id)
+                .order_by(Book.id)
+            )
+            async for row in await db.stream(books.execution_options(yield_per=EXPORT_YIELD_PER)):
+                lines.append(json.dumps(book_record(row)) + "\n")
+
+            columns = [Note.id, Note.book_id, Note.text, Note.created_at]
+            if vectors != "none":
+                columns += [
+                    NoteEmbedding.model_name,
+                    NoteEmbedding.embedding_blob,
+                    NoteEmbedding.embedding_dtype,
+                    NoteEmbedding.embedding_dim,
+                    NoteEmbedding.embedding_json,
+                ]
+            notes = select(*columns).where(Note.user_id == user_id).order_by(Note.id)
+            if vectors != "none":
+                notes = notes.outerjoin(
+                    NoteEmbedding, and_(NoteEmbedding.note_id == Note.id, NoteEmbedding.model_name == model_name)
+                )
+            async for row in await db.stream(notes.execution_options(yield_per=EXPORT_YIELD_PER)):
+                lines.append(json.dumps(note_record(row, vectors)) + "\n")
+                if len(lines) >= EXPORT_LINES_PER_CHUNK:
+                    yield "".join(lines)
+                    lines = []
+        if lines:
+            yield "".join(lines)
+
+    return StreamingResponse(
+        records(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="notes.ndjson"'},
+    )
+
+@app.post("/import/notes", response_model=ImportOut)
+async def import_notes(request: Request, user_id: str = Depends(get_current_user_id)):
+    """Import an /export/notes stream, committing every IMPORT_CHUNK notes.
+
+    Book records are recreated and note book_ids remapped to them; created_at is
+    kept. Notes whose exported vector came from the current model are stored
+    without re-embedding.
+    """
+    model_name = get_model_name()
+    out = ImportOut()
+    book_ids: dict[int, int] = {}  # exported book id -> new book id
+    pending: list[tuple[int, NoteCreate, Optional[np.ndarray], Optional[datetime]]] = []
+
+    def fail(line: int, error: str):
+        out.failed += 1
+        if len(out.errors) < IMPORT_MAX_ERRORS:
+            out.errors.append(ImportLineError(line=line, error=error))
+
+    async def flush():
+        known_books = await _known_books(user_id, {p.book_id for _, p, _, _ in pending if p.book_id is not None})
+        accepted = []
+        for line, p, vec, created_at in pending:
+            if p.book_id is not None and p.book_id not in known_books:
+                fail(line, "book_id does not exist")
+            else:
+                accepted.append((p, vec, created_at))
+        pending.clear()
+        if accepted:
+            payloads, vecs, created_ats = zip(*accepted)
+            await _store_notes(user_id, list(payloads), list(vecs), list(created_ats))
+            out.notes_created += len(accepted)
+            out.embeddings_reused += sum(vec is not None for vec in vecs)
+
+    line = 0
+    async for raw in ndjson_lines(request):
+        line += 1
+        try:
+            record = json.loads(raw)
+        except ValueError as e:
+            fail(line, f"invalid JSON: {e}")
+            continue
+        if not isinstance(record, dict):
+            fail(line, "record must be a JSON object")
+            continue
+
+        try:
+            created_at = datetime.fromisoformat(record["created_at"]) if record.get("created_at") else None
+            if record.get("type") == "book":
+                payload = BookCreate.model_validate(record)
+                export_id = record.get("id")
+                # Checked before the insert so a book is never created without being counted
+                if export_id is not None and (not isinstance(export_id, int) or isinstance(export_id, bool)):
+                    fail(line, "id must be an integer")
+                    continue
+                async with AsyncSessionLocal() as db:
+                    book = Book(user_id=user_id, title=payload.title, author=payload.author)
+                    if created_at is not None:
+                        book.created_at = created_at
+                    db.add(book)
+                    await db.commit()
+                if export_id is not None:
+                    book_ids[export_id] = book.id
+                out.books_created += 1
+                continue
+
+            payload = NoteCreate.model_validate(record)
+        except ValidationError as e:
+            fail(line, _validation_message(e))
+            continue
+        except (TypeError, ValueError):
+            fail(line, "created_at must be an ISO 8601 timestamp")
+            continue
+        if payload.book_id is not None:
+            # Exported book ids mean nothing outside the export; only books recreated above are valid
+            if payload.book_id not in book_ids:
+                fail(line, "book_id does not match a book record earlier in the import")
+                continue
+            payload.book_id = book_ids[payload.book_id]
+        try:
+            vec = record_vector(record, model_name)
+        except ValueError as e:
+            fail(line, str(e))
+            continue
+        pending.append((line, payload, vec, created_at))
+        if len(pending) >= IMPORT_CHUNK:
+            await flush()
+
+    if pending:
+        await flush()
+    return out
 
 @app.get("/notes", response_model=List[NoteOut])
-def list_notes(limit: int = 50, offset: int = 0, book_id: Optional[int] = None, user_id: str = Depends(get_current_user_id)):
+async def list_notes(
+    response: Response,
+    limit: int = 50,
+    offset: int = 0,
+    book_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_user_id),
+):
+    """Newest notes first. Pass the X-Next-Cursor header of a page as `cursor` to fetch the next one."""
     if not (1 <= limit <= 200):
         raise HTTPException(status_code=400, detail="limit must be 1..200")
     if offset < 0:
         raise HTTPException(status_code=400, detail="offset must be >= 0")
 
-    with SessionLocal() as db:
+    async with span("db"), AsyncSessionLocal() as db:
         stmt = select(Note).where(Note.user_id == user_id)
         if book_id is not None:
             stmt = stmt.where(Note.book_id == book_id)
 
-        stmt = stmt.order_by(Note.created_at.desc()).limit(limit).offset(offset)
-        return list(db.scalars(stmt).all())
+        stmt = keyset_page(stmt, Note, limit, offset, cursor)
+        notes = list((await db.scalars(stmt)).all())
+
+    cursor_out = next_cursor(notes, limit)
+    if cursor_out is not None:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_out
+    return notes
     
 @app.post("/books", response_model=BookOut, status_code=201)
-def create_book(payload: BookCreate, user_id: str = Depends(get_current_user_id)):
-    with SessionLocal() as db:
+async def create_book(payload: BookCreate, user_id: str = Depends(get_current_user_id)):
+    async with AsyncSessionLocal() as db:
         book = Book(user_id=user_id, title=payload.title, author=payload.author)
         db.add(book)
-        db.commit()
-        db.refresh(book)
+        await db.commit()
+        await db.refresh(book)
         return book
 
 @app.get("/books", response_model=List[BookOut])
-def list_books(limit: int = 50, offset: int = 0, user_id: str = Depends(get_current_user_id)):
+async def list_books(
+    response: Response,
+    limit: int = 50,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_user_id),
+):
     if not (1 <= limit <= 200):
         raise HTTPException(status_code=400, detail="limit must be 1..200")
     if offset < 0:
         raise HTTPException(status_code=400, detail="offset must be >= 0")
 
+    async with span("db"), AsyncSessionLocal() as db:
+        stmt = keyset_page(select(Book).where(Book.user_id == user_id), Book, limit, offset, cursor)
+        books = list((await db.scalars(stmt)).all())
+
+    cursor_out = next_cursor(books, limit)
+    if cursor_out is not None:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_out
+    return books
+
+def _build_user_index(user_id: str, model_name: str):
+    with SessionLocal() as db:
+        return load_user_index(db, user_id, model_name)
+
+async def get_user_index(user_id: str, model_name: str):
+    index = vector_index.get((user_id, model_name))
+    if index is None:
+        # Cold builds read through the sync engine on the threadpool, leaving the CPU executor to inference
+        with span("vector_load"):
+            index = await run_in_threadpool(
+                vector_index.get_or_build, (user_id, model_name), lambda: _build_user_index(user_id, model_name)
+            )
+    return index
+
+def _build_term_index(user_id: str) -> TermIndex:
     with SessionLocal() as db:
-        stmt = select(Book).where(Book.user_id == user_id).order_by(Book.created_at.desc()).limit(limit).offset(offset)
-        return list(db.scalars(stmt).all())
+        return load_term_index(db, user_id)
+
+async def get_term_index(user_id: str) -> TermIndex:
+    index = term_index.get(user_id)
+    if index is None:
+        with span("term_load"):
+            index = await run_in_threadpool(term_index.get_or_build, user_id, lambda: _build_term_index(user_id))
+    return index
     
+async def _dense_search(
+    user_id: str,
+    model_name: str,
+    q_vec,
+    k: int,
+    book_id: Optional[int] = None,
+    mode: str = "exact",
+    nprobe: int = ANN_DEFAULT_NPROBE,
+    note_ids: Optional[List[int]] = None,
+):
+    if PGVECTOR_ENABLED:
+        # Scoring happens inside Postgres, so the whole query counts as the score stage
+        async with span("score"), AsyncSessionLocal() as db:
+            return await pgvector_search(
+                db, user_id, model_name, q_vec, k, book_id=book_id, exact=mode == "exact", note_ids=note_ids
+            )
+
+    index = await get_user_index(user_id, model_name)
+    with span("score"):
+        if note_ids is not None:
+            return await run_cpu(index.score_ids, q_vec, note_ids, k)
+        return await run_cpu(index.search, q_vec, k, book_id=book_id, mode=mode, nprobe=nprobe)
+
+async def _hybrid_search(user_id: str, model_name: str, q: str, q_vec, k: int, book_id: Optional[int], prefilter: bool):
+    """Reciprocal-rank fusion of full-text and dense rankings; scores are the fused RRF scores."""
+    n = max(HYBRID_CANDIDATES, k)
+    async with span("lexical"), AsyncSessionLocal() as db:
+        lexical = await lexical_search(db, user_id, q, n, book_id=book_id)
+    lexical_ids = [note_id for note_id, _ in lexical]
+
+    # With prefilter, only the lexical candidates are scored densely instead of the whole library.
+    # Exact in Postgres too: the shared HNSW index filters by user and candidate ids only after its scan.
+    if prefilter and lexical_ids:
+        dense = await _dense_search(user_id, model_name, q_vec, n, note_ids=lexical_ids)
+    else:
+        dense = await _dense_search(user_id, model_name, q_vec, n, book_id=book_id)
+    return rrf_fuse([[note_id for note_id, _ in dense], lexical_ids])[:k]
+
 @app.get("/search/notes", response_model=List[NoteSearchHit])
-def search_notes(q: str, k: int = 10, book_id: Optional[int] = None, user_id: str = Depends(get_current_user_id)):
+async def search_notes(
+    q: str,
+    k: int = 10,
+    book_id: Optional[int] = None,
+    mode: str = "exact",
+    nprobe: int = ANN_DEFAULT_NPROBE,
+    prefilter: bool = False,
+    user_id: str = Depends(get_current_user_id),
+):
     if not q.strip():
         raise HTTPException(status_code=400, detail="q must not be empty")
     if not (1 <= k <= 50):
         raise HTTPException(status_code=400, detail="k must be 1..50")
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(SEARCH_MODES)}")
+    if not (1 <= nprobe <= 1024):
+        raise HTTPException(status_code=400, detail="nprobe must be 1..1024")
+
+    with span("embed"):
+        model_name, q_vec = await run_cpu(embed_query, q)
+    if mode == "hybrid":
+        top = await _hybrid_search(user_id, model_name, q, q_vec, k, book_id, prefilter)
+    else:
+        top = await _dense_search(user_id, model_name, q_vec, k, book_id=book_id, mode=mode, nprobe=nprobe)
+    if not top:
+        return []
+
+    async with span("db"), AsyncSessionLocal() as db:
+        notes = {n.id: n for n in await db.scalars(select(Note).where(Note.id.in_([note_id for note_id, _ in top])))}
+    with span("serialize"):
+        return [
+            NoteSearchHit(note=NoteOut.model_validate(notes[note_id]), score=round(score, 4))
+            for note_id, score in top
+            if note_id in notes
+        ]
 
-    model_name, q_emb_json = embed_text(q)
-    q_vec = load_vec(q_emb_json)
 
-    with SessionLocal() as db:
-        # Pull notes + embeddings for the specified model (and book, if given)
-        stmt = (
-            select(Note, NoteEmbedding)
-            .join(NoteEmbedding, NoteEmbedding.note_id == Note.id)
-            .where(NoteEmbedding.model_name == model_name)
-            .where(Note.user_id == user_id)
-        )
-        if book_id is not None:
-            stmt = stmt.where(Note.book_id == book_id)
+@app.post("/search/notes/batch", response_model=List[BatchSearchOut])
+async def search_notes_batch(payload: BatchSearchIn, user_id: str = Depends(get_current_user_id)):
+    """Exact search for several queries at once: one encode call, one scoring pass, one note fetch."""
+    if not payload.queries:
+        raise HTTPException(status_code=400, detail="queries must not be empty")
+    if len(payload.queries) > BATCH_SEARCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"at most {BATCH_SEARCH_MAX_QUERIES} queries per request")
+    if any(not q.strip() for q in payload.queries):
+        raise HTTPException(status_code=400, detail="queries must not be empty strings")
+    if not (1 <= payload.k <= 50):
+        raise HTTPException(status_code=400, detail="k must be 1..50")
 
-        rows = db.execute(stmt).all()
+    with span("embed"):
+        model_name, q_vecs = await run_cpu(embed_queries, payload.queries)
+    if PGVECTOR_ENABLED:
+        tops = [await _dense_search(user_id, model_name, q_vec, payload.k, book_id=payload.book_id) for q_vec in q_vecs]
+    else:
+        index = await get_user_index(user_id, model_name)
+        with span("score"):
+            tops = await run_cpu(index.search_many, q_vecs, payload.k, payload.book_id)
+
+    note_ids = {note_id for top in tops for note_id, _ in top}
+    notes = {}
+    if note_ids:
+        async with span("db"), AsyncSessionLocal() as db:
+            notes = {n.id: n for n in await db.scalars(select(Note).where(Note.id.in_(note_ids)))}
+    with span("serialize"):
+        return [
+            BatchSearchOut(
+                query=q,
+                hits=[
+                    NoteSearchHit(note=NoteOut.model_validate(notes[note_id]), score=round(score, 4))
+                    for note_id, score in top
+                    if note_id in notes
+                ],
+            )
+            for q, top in zip(payload.queries, tops)
+        ]
 
-        scored = []
-        for note, emb in rows:
-            vec = load_vec(emb.embedding_json)
-            score = cosine_sim(q_vec, vec)
-            score = round(score, 4)
-            scored.append((score, note))
 
-        scored.sort(key=lambda x: x[0], reverse=True)
-        top = scored[:k]
+def _search_recall(index, k: int, nprobe: int, samples: int) -> SearchRecallOut:
+    matrix, _, _ = index.snapshot()
+    if not len(matrix):
+        raise HTTPException(status_code=400, detail="no embedded notes to sample")
+
+    rng = np.random.default_rng(0)
+    queries = matrix[rng.choice(len(matrix), min(samples, len(matrix)), replace=False)]
+    n_lists = index.ivf(matrix).n_lists
+
+    int8 = index.quantized(matrix)
+
+    t0 = time.perf_counter()
+    exact = [[i for i, _ in index.search(q, k, quantized=False)] for q in queries]
+    t1 = time.perf_counter()
+    # Thresholds off: report what the IVF and int8 passes give, even where search would scan exactly
+    approx = [[i for i, _ in index.search(q, k, mode="approx", nprobe=nprobe, quantized=False, approx_min_rows=0)] for q in queries]
+    t2 = time.perf_counter()
+    quantized = [[i for i, _ in index.search(q, k, quantized=True)] for q in queries]
+    t3 = time.perf_counter()
+
+    return SearchRecallOut(
+        k=k,
+        nprobe=nprobe,
+        samples=len(queries),
+        n_notes=len(matrix),
+        n_lists=n_lists,
+        recall=round(recall_at_k(exact, approx), 4),
+        exact_ms=round(1000 * (t1 - t0) / len(queries), 3),
+        approx_ms=round(1000 * (t2 - t1) / len(queries), 3),
+        int8_recall=round(recall_at_k(exact, quantized), 4),
+        int8_ms=round(1000 * (t3 - t2) / len(queries), 3),
+        float32_mb=round(matrix.nbytes / 2**20, 2),
+        int8_mb=round(int8.nbytes / 2**20, 2),
+    )
+
+@app.get("/search/notes/recall", response_model=SearchRecallOut)
+async def search_recall(k: int = 10, nprobe: int = ANN_DEFAULT_NPROBE, samples: int = 50, user_id: str = Depends(get_current_user_id)):
+    """Recall@k of approx mode and of the int8 scan against the exact float32 scan, using the user's own note vectors as queries."""
+    if not (1 <= k <= 50):
+        raise HTTPException(status_code=400, detail="k must be 1..50")
+    if not (1 <= nprobe <= 1024):
+        raise HTTPException(status_code=400, detail="nprobe must be 1..1024")
+    if not (1 <= samples <= 500):
+        raise HTTPException(status_code=400, detail="samples must be 1..500")
 
-        return [
-            NoteSearchHit(note=NoteOut.model_validate(note), score=score)
-            for score, note in top
-        ]
+    index = await get_user_index(user_id, get_model_name())
+    return await run_cpu(_search_recall, index, k, nprobe, samples)
 
 
 # tests embedding retrieval
 @app.get("/notes/{note_id}/embedding")
-def get_embedding(note_id: int):
-    with SessionLocal() as db:
-        emb = db.execute(select(NoteEmbedding).where(NoteEmbedding.note_id == note_id)).scalar_one_or_none()
+async def get_embedding(note_id: int):
+    async with AsyncSessionLocal() as db:
+        emb = (
+            await db.execute(
+                select(NoteEmbedding)
+                .where(NoteEmbedding.note_id == note_id)
+                .where(NoteEmbedding.model_name == get_model_name())
+            )
+        ).scalar_one_or_none()
         if emb is None:
             raise HTTPException(status_code=404, detail="embedding not found")
-        return {"note_id": note_id, "model_name": emb.model_name, "embedding_len": len(__import__("json").loads(emb.embedding_json))}
+        return {"note_id": note_id, "model_name": emb.model_name, "embedding_len": int(load_vec(emb).shape[0])}
+
+
+@app.get("/notes/{note_id}/embedding/status", response_model=EmbeddingStatusOut)
+def get_embedding_status(note_id: int, user_id: str = Depends(get_current_user_id)):
+    with SessionLocal() as db:
+        note = db.get(Note, note_id)
+        if note is None or note.user_id != user_id:
+            raise HTTPException(status_code=404, detail="note not found")
+        status, job = embedding_status(db, note_id)
+        if job is None:
+            return EmbeddingStatusOut(note_id=note_id, status=status)
+        return EmbeddingStatusOut(note_id=note_id, status=status, attempts=job.attempts, error=job.last_error)
+
+
+@app.get("/notes/{note_id}/related", response_model=List[NoteSearchHit])
+async def related_notes(note_id: int, k: int = 10, user_id: str = Depends(get_current_user_id)):
+    """The note's most similar notes, read from its precomputed neighbour list."""
+    if not (1 <= k <= RELATED_TOP_N):
+        raise HTTPException(status_code=400, detail=f"k must be 1..{RELATED_TOP_N}")
+
+    model_name = get_model_name()
+    async with span("db"), AsyncSessionLocal() as db:
+        note = await db.get(Note, note_id)
+        if note is None or note.user_id != user_id:
+            raise HTTPException(status_code=404, detail="note not found")
+        row = (
+            await db.scalars(
+                select(NoteNeighbors)
+                .where(NoteNeighbors.note_id == note_id)
+                .where(NoteNeighbors.model_name == model_name)
+            )
+        ).first()
+    if row is not None:
+        top = unpack(row)
+    else:
+        with span("score"):
+            top = await run_in_threadpool(compute_neighbors, user_id, model_name, note_id)
+        if top is None:
+            raise HTTPException(status_code=404, detail="embedding not found")
+    top = top[:k]
+    if not top:
+        return []
+
+    async with span("db"), AsyncSessionLocal() as db:
+        notes = {n.id: n for n in await db.scalars(select(Note).where(Note.id.in_([i for i, _ in top])))}
+    with span("serialize"):
+        return [
+            NoteSearchHit(note=NoteOut.model_validate(notes[i]), score=round(score, 4))
+            for i, score in top
+            if i in notes
+        ]
+
 
+CLUSTER_MAX_REPS = 10  # stored results keep this many representatives; requests slice to per_cluster
+
+def _content_version(count: int, max_embedding_id: Optional[int]) -> str:
+    return f"{count}:{max_embedding_id or 0}"
+
+def _cluster_results(
+    rows, k: int, cached: Optional[ClusterResult], refresh: bool, terms: TermIndex
+) -> tuple[List[ClusterOut], dict]:
+    notes = [note for note, _ in rows]
+    terms.add_many([n.id for n in notes], [n.text for n in notes])
+    with span("vector_load"):
+        X = np.vstack([load_vec(emb) for _, emb in rows])
+    ids = np.array([n.id for n in notes], dtype=np.int64)
+
+    labels = None
+    if cached is not None and not refresh:
+        centers = np.frombuffer(cached.centroids, dtype=np.float32).reshape(k, -1)
+        if centers.shape[1] == X.shape[1]:
+            assigned = incremental_labels(
+                ids,
+                X,
+                np.frombuffer(cached.note_ids, dtype=np.int64),
+                np.frombuffer(cached.labels, dtype=np.int32),
+                centers,
+                cached.fitted_count,
+                cached.fitted_spread,
+            )
+            if assigned is not None:
+                labels, order = assigned
+                fitted_count, fitted_spread = cached.fitted_count, cached.fitted_spread
+
+    if labels is None:
+        with span("kmeans"):
+            labels, centers = kmeans_clusters(X, k=k)
+        centers = np.asarray(centers, dtype=np.float32)
+        fitted_count, fitted_spread = len(X), mean_sq_distance(X, labels, centers)
+        order = np.arange(len(X))
+
+    # For each cluster, pick representative notes closest to centroid
+    results: List[ClusterOut] = []
+    for cid in range(k):
+        idxs = np.where(labels == cid)[0]
+        if not len(idxs):
+            continue
+        cluster_notes = [notes[i] for i in idxs]
+        cluster_vecs = X[idxs]
+        centroid = centers[cid]
+
+        sims = cluster_vecs @ centroid
+        rep_order = np.argsort(-sims)[:CLUSTER_MAX_REPS]
+
+        reps = []
+        for j in rep_order:
+            note_obj = cluster_notes[j]
+            reps.append(
+                ClusterNote(
+                    note=NoteOut.model_validate(note_obj),
+                    score=float(sims[j]),
+                )
+            )
+
+        # Keywords: cluster rows of the user's term index, scored with corpus-wide IDF
+        with span("tfidf"):
+            kw = terms.keywords([n.id for n in cluster_notes], top_n=5)
+
+        results.append(
+            ClusterOut(
+                cluster_id=cid,
+                size=len(cluster_notes),
+                keywords=kw,
+                representatives=reps,
+            )
+        )
+
+    # Sort clusters by size
+    results.sort(key=lambda c: c.size, reverse=True)
+
+    state = {
+        "content_version": _content_version(len(rows), max(emb.id for _, emb in rows)),
+        "fitted_count": fitted_count,
+        "fitted_spread": fitted_spread,
+        # Fitted notes first, so later calls can tell them from notes assigned since
+        "note_ids": ids[order].tobytes(),
+        "labels": np.asarray(labels, dtype=np.int32)[order].tobytes(),
+        "centroids": np.ascontiguousarray(centers, dtype=np.float32).tobytes(),
+        "result_json": json.dumps([c.model_dump(mode="json") for c in results]),
+    }
+    return results, state
+
+def _slice_representatives(results: List[ClusterOut], per_cluster: int) -> List[ClusterOut]:
+    return [c.model_copy(update={"representatives": c.representatives[:per_cluster]}) for c in results]
 
 @app.get("/clusters/recompute", response_model=List[ClusterOut])
-def recompute_clusters(k: int = 5, per_cluster: int = 3, book_id: Optional[int] = None, user_id: str = Depends(get_current_user_id)):
+async def recompute_clusters(
+    k: int = 5,
+    per_cluster: int = 3,
+    book_id: Optional[int] = None,
+    refresh: bool = False,
+    user_id: str = Depends(get_current_user_id),
+):
     if not (2 <= k <= 20):
         raise HTTPException(status_code=400, detail="k must be 2..20")
-    if not (1 <= per_cluster <= 10):
-        raise HTTPException(status_code=400, detail="per_cluster must be 1..10")
+    if not (1 <= per_cluster <= CLUSTER_MAX_REPS):
+        raise HTTPException(status_code=400, detail=f"per_cluster must be 1..{CLUSTER_MAX_REPS}")
 
-    model_name, _ = embed_text("model_probe")
+    model_name = get_model_name()
 
-    with SessionLocal() as db:
-        stmt = (
-            select(Note, NoteEmbedding)
-            .join(NoteEmbedding, NoteEmbedding.note_id == Note.id)
+    async with span("db"), AsyncSessionLocal() as db:
+        version_stmt = (
+            select(func.count(NoteEmbedding.id), func.max(NoteEmbedding.id))
+            .join(Note, NoteEmbedding.note_id == Note.id)
             .where(Note.user_id == user_id)
             .where(NoteEmbedding.model_name == model_name)
         )
+        cached_stmt = (
+            select(ClusterResult)
+            .where(ClusterResult.user_id == user_id)
+            .where(ClusterResult.k == k)
+            .where(ClusterResult.model_name == model_name)
+        )
         if book_id is not None:
-            stmt = stmt.where(Note.book_id == book_id)
+            version_stmt = version_stmt.where(Note.book_id == book_id)
+            cached_stmt = cached_stmt.where(ClusterResult.book_id == book_id)
+        else:
+            cached_stmt = cached_stmt.where(ClusterResult.book_id.is_(None))
 
-        rows = db.execute(stmt).all()
-        if len(rows) < k:
-            raise HTTPException(status_code=400, detail=f"need at least {k} notes to cluster")
+        count, max_embedding_id = (await db.execute(version_stmt)).one()
+        cached = (await db.scalars(cached_stmt.order_by(ClusterResult.id.desc()).limit(1))).first()
 
-        notes = [note for note, _ in rows]
-        embs = [load_vec(emb.embedding_json) for _, emb in rows]
-        X = np.vstack(embs)
-
-        labels, centers = kmeans_clusters(X, k=k)
-
-        # For each cluster, pick representative notes closest to centroid
-        results: List[ClusterOut] = []
-        for cid in range(k):
-            idxs = np.where(labels == cid)[0]
-            cluster_notes = [notes[i] for i in idxs]
-            cluster_vecs = X[idxs]
-            centroid = centers[cid]
-
-            sims = cluster_vecs @ centroid
-            order = np.argsort(-sims)[:per_cluster]
-
-            reps = []
-            for j in order:
-                note_obj = cluster_notes[j]
-                reps.append(
-                    ClusterNote(
-                        note=NoteOut.model_validate(note_obj),
-                        score=float(sims[j]),
-                    )
-                )
+        # Unchanged corpus: serve the stored result without touching the vectors
+        if cached is not None and not refresh and cached.content_version == _content_version(count, max_embedding_id):
+            results = [ClusterOut.model_validate(c) for c in json.loads(cached.result_json)]
+            return _slice_representatives(results, per_cluster)
 
-            # Keywords from cluster text
-            kw = top_keywords([n.text for n in cluster_notes], top_n=5)
+        if count < k:
+            raise HTTPException(status_code=400, detail=f"need at least {k} notes to cluster")
 
-            results.append(
-                ClusterOut(
-                    cluster_id=cid,
-                    size=len(cluster_notes),
-                    keywords=kw,
-                    representatives=reps,
-                )
-            )
+        stmt = (
+            select(Note, NoteEmbedding)
+            .join(NoteEmbedding, NoteEmbedding.note_id == Note.id)
+            .where(Note.user_id == user_id)
+            .where(NoteEmbedding.model_name == model_name)
+        )
+        if book_id is not None:
+            stmt = stmt.where(Note.book_id == book_id)
 
-        # Sort clusters by size
-        results.sort(key=lambda c: c.size, reverse=True)
-        return results
+        rows = (await db.execute(stmt)).all()
+    if len(rows) < k:
+        raise HTTPException(status_code=400, detail=f"need at least {k} notes to cluster")
+
+    # KMeans and TF-IDF run on the CPU executor once the session is released
+    terms = await get_term_index(user_id)
+    results, state = await run_cpu(_cluster_results, rows, k, cached, refresh, terms)
+
+    async with span("db"), AsyncSessionLocal() as db:
+        stored = await db.get(ClusterResult, cached.id) if cached is not None else None
+        if stored is None:
+            stored = ClusterResult(user_id=user_id, book_id=book_id, k=k, model_name=model_name)
+            db.add(stored)
+        for field, value in state.items():
+            setattr(stored, field, value)
+        stored.updated_at = datetime.now(timezone.utc)
+        await db.commit()
+
+    return _slice_representatives(results, per_cluster)
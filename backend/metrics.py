@@ -0,0 +1,215 @@
+import bisect
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this are logged with their stage breakdown; 0 disables
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+# Allows profiling a single request with an `X-Profile: 1` header; never enable on a public deployment
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "0").lower() in ("1", "true", "yes")
+PROFILE_HEADER = b"x-profile"
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (stage, seconds) pairs recorded during the current request; None outside a request
+_spans: ContextVar[Optional[list]] = ContextVar("request_spans", default=None)
+
+
+class Histogram:
+    """Cumulative Prometheus histogram, one series per label tuple."""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...], buckets: tuple[float, ...] = DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}  # label values -> [bucket counts..., sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            sep = "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="{le}"}} {cumulative}')
+            braced = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{braced} {values[-1]}")
+            lines.append(f"{self.name}_count{braced} {cumulative}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+request_seconds = Histogram(
+    "http_request_duration_seconds", "Request latency by route template.", ("method", "route", "status")
+)
+stage_seconds = Histogram("request_stage_duration_seconds", "Time spent in each request stage.", ("stage",))
+
+# Extra samples appended to /metrics: callables returning (name, type, help, value) tuples
+_collectors: list[Callable[[], list[tuple[str, str, str, float]]]] = []
+
+
+def register_collector(collect: Callable[[], list[tuple[str, str, str, float]]]) -> None:
+    _collectors.append(collect)
+
+
+def render_metrics() -> str:
+    lines = request_seconds.render() + stage_seconds.render()
+    for collect in _collectors:
+        for name, kind, help, value in collect():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+class span:
+    """Time a block as one stage of the current request (reported in Server-Timing and /metrics).
+
+    Works with both `with` and `async with`, so it can share a line with an
+    async session. Worker threads see the request's spans as long as the
+    context is copied, which run_cpu and run_in_threadpool both do.
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._t0
+        stage_seconds.observe(elapsed, self.stage)
+        spans = _spans.get()
+        if spans is not None:
+            spans.append((self.stage, elapsed))
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        return self.__exit__(*exc)
+
+
+def server_timing(spans: list, total: float) -> str:
+    totals: dict[str, float] = {}
+    for stage, elapsed in spans:
+        totals[stage] = totals.get(stage, 0.0) + elapsed
+    parts = [f"{stage};dur={1000 * elapsed:.2f}" for stage, elapsed in totals.items()]
+    parts.append(f"total;dur={1000 * total:.2f}")
+    return ", ".join(parts)
+
+
+class TimedJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        with span("serialize"):
+            return super().render(content)
+
+
+class TimingMiddleware:
+    """Times each HTTP request, adds a Server-Timing header and feeds the /metrics histograms.
+
+    With PROFILE_REQUESTS on, a request carrying `X-Profile: 1` is run under
+    pyinstrument (or cProfile when it is not installed) and answered with the
+    profile instead of its normal response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if PROFILE_REQUESTS and dict(scope["headers"]).get(PROFILE_HEADER) == b"1":
+            return await self._profile(scope, receive, send)
+
+        spans: list = []
+        token = _spans.set(spans)
+        t0 = time.perf_counter()
+        status = 500
+
+        async def send_timed(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = server_timing(spans, time.perf_counter() - t0).encode()
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header)]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            _spans.reset(token)
+            elapsed = time.perf_counter() - t0
+            route = scope.get("route")
+            # Route templates, not raw paths, keep the label set bounded
+            route_label = route.path if route is not None else "unmatched"
+            request_seconds.observe(elapsed, scope["method"], route_label, str(status))
+            if SLOW_REQUEST_MS and 1000 * elapsed >= SLOW_REQUEST_MS:
+                logger.warning(
+                    "slow request %s %s %.0fms",
+                    scope["method"],
+                    route_label,
+                    1000 * elapsed,
+                    extra={"route": route_label, "status": status, "duration_ms": 1000 * elapsed, "spans": spans},
+                )
+
+    async def _profile(self, scope, receive, send):
+        async def discard(message):
+            pass
+
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            Profiler = None
+
+        if Profiler is not None:
+            profiler = Profiler(async_mode="enabled")
+            with profiler:
+                await self.app(scope, receive, discard)
+            body, content_type = profiler.output_html().encode(), b"text/html; charset=utf-8"
+        else:
+            # cProfile only sees the event loop thread, not work handed to the executors
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await self.app(scope, receive, discard)
+            finally:
+                profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(60)
+            body, content_type = out.getvalue().encode(), b"text/plain; charset=utf-8"
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,8 +1,8 @@
 from datetime import datetime, timezone
-from sqlalchemy import Column, DateTime, Integer, Text, String, ForeignKey, Float
+from sqlalchemy import Column, DateTime, Integer, Text, String, ForeignKey, Float, LargeBinary, Index
 # from sqlalchemy import Text as SqlText
 from sqlalchemy.orm import relationship
-from db import Base
+from db import Base, PGVECTOR_DIM, PGVECTOR_ENABLED
 from sqlalchemy import String
 
 
@@ -13,9 +13,16 @@ class Note(Base):
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
     book_id = Column(Integer, ForeignKey("books.id"), nullable=True, index=True)
     book = relationship("Book", back_populates="notes")
-    embedding = relationship("NoteEmbedding", back_populates="note", uselist=False, cascade="all, delete-orphan")
+    # One row per model the note has been embedded with; more than one while a re-embed runs
+    embeddings = relationship("NoteEmbedding", back_populates="note", cascade="all, delete-orphan")
     user_id = Column(String, index=True, nullable=False)
 
+    # Keyset pagination on (created_at, id), per user and per user+book
+    __table_args__ = (
+        Index("ix_notes_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_notes_user_id_book_id_created_at_id", "user_id", "book_id", "created_at", "id"),
+    )
+
 
 class Book(Base):
     __tablename__ = "books"
@@ -28,6 +35,10 @@ class Book(Base):
     notes = relationship("Note", back_populates="book", cascade="all, delete-orphan")
     user_id = Column(String, index=True, nullable=False)
 
+    __table_args__ = (
+        Index("ix_books_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
+
 
 class NoteEmbedding(Base):
     __tablename__ = "note_embeddings"
@@ -35,8 +46,79 @@ class NoteEmbedding(Base):
     id = Column(Integer, primary_key=True, index=True)
     note_id = Column(Integer, ForeignKey("notes.id"), nullable=False, index=True)
     model_name = Column(String(255), nullable=False)
-    embedding_json = Column(Text, nullable=False)
+    # Legacy JSON encoding; kept as a fallback for rows not yet backfilled into embedding_blob
+    embedding_json = Column(Text, nullable=True)
+    embedding_blob = Column(LargeBinary, nullable=True)
+    embedding_dtype = Column(String(16), nullable=True)
+    embedding_dim = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    note = relationship("Note", back_populates="embeddings")
+
+    __table_args__ = (
+        Index("ix_note_embeddings_note_id_model_name", "note_id", "model_name", unique=True),
+    )
+
+
+if PGVECTOR_ENABLED:
+    from pgvector.sqlalchemy import Vector
+
+    NoteEmbedding.embedding_vec = Column(Vector(PGVECTOR_DIM), nullable=True)
+
+
+
+class EmbeddingJob(Base):
+    __tablename__ = "embedding_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    note_id = Column(Integer, ForeignKey("notes.id"), nullable=False, index=True)
+    model_name = Column(String(255), nullable=False)
+    # pending -> running -> done, or back to pending with a backoff until attempts run out (failed)
+    status = Column(String(16), nullable=False, default="pending", index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
-    note = relationship("Note", back_populates="embedding")
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+
+class ClusterResult(Base):
+    __tablename__ = "cluster_results"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, nullable=False, index=True)
+    book_id = Column(Integer, nullable=True)
+    k = Column(Integer, nullable=False)
+    model_name = Column(String(255), nullable=False)
+    # "<embedding count>:<max embedding id>" of the corpus the result was computed from
+    content_version = Column(String(64), nullable=False)
+    fitted_count = Column(Integer, nullable=False)
+    fitted_spread = Column(Float, nullable=False)
+    note_ids = Column(LargeBinary, nullable=False)  # int64
+    labels = Column(LargeBinary, nullable=False)  # int32, parallel to note_ids
+    centroids = Column(LargeBinary, nullable=False)  # float32, k x dim
+    result_json = Column(Text, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+
+class NoteNeighbors(Base):
+    __tablename__ = "note_neighbors"
+
+    id = Column(Integer, primary_key=True, index=True)
+    note_id = Column(Integer, ForeignKey("notes.id"), nullable=False)
+    model_name = Column(String(255), nullable=False)
+    neighbor_ids = Column(LargeBinary, nullable=False)  # int64, best first
+    scores = Column(LargeBinary, nullable=False)  # float32 cosine, parallel to neighbor_ids
+    # Score a new note must beat to enter a full list; NULL while the list has room
+    kth_score = Column(Float, nullable=True)
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+
+    __table_args__ = (
+        Index("ix_note_neighbors_note_id_model_name", "note_id", "model_name", unique=True),
+    )
+
 
+class AppSetting(Base):
+    """Small runtime settings shared by every process, e.g. the active embedding model."""
+    __tablename__ = "app_settings"
 
+    key = Column(String(64), primary_key=True)
+    value = Column(Text, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), nullable=False)
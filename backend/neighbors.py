@@ -0,0 +1,171 @@
+"""Precomputed related notes: each note's top-N most similar notes of the same user.
+
+A note's list is written when its vector is stored, and the new note is
+offered to the lists of its nearest existing notes, so /notes/{id}/related
+is a row lookup rather than a scan. Lists missing for any reason (bulk
+imports, lost updates) are computed on first read.
+"""
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from db import SessionLocal
+from index import UserIndex, load_user_index, vector_index
+from models import Note, NoteNeighbors
+
+logger = logging.getLogger(__name__)
+
+RELATED_TOP_N = int(os.getenv("RELATED_TOP_N", "20"))
+# A new note is offered to the lists of this many of its nearest notes. A note further
+# away only gains it if its own list is unusually weak; that list catches up on rebuild.
+RELATED_REVERSE_CANDIDATES = int(os.getenv("RELATED_REVERSE_CANDIDATES", "200"))
+# Writes of more notes than this drop the user's lists instead, to be recomputed as they are read
+RELATED_INCREMENTAL_MAX = int(os.getenv("RELATED_INCREMENTAL_MAX", "64"))
+
+IN_CHUNK = 500  # ids per IN (...) list
+
+# Lists are read, merged and written back; this keeps the threads of one process from interleaving
+_lock = threading.Lock()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def pack(hits: list[tuple[int, float]]) -> dict:
+    """Column values for storing hits (best first) on a NoteNeighbors row."""
+    scores = np.asarray([s for _, s in hits], dtype=np.float32)
+    return {
+        "neighbor_ids": np.asarray([i for i, _ in hits], dtype=np.int64).tobytes(),
+        "scores": scores.tobytes(),
+        "kth_score": float(scores[-1]) if len(hits) >= RELATED_TOP_N else None,
+        "updated_at": _now(),
+    }
+
+
+def unpack(row: NoteNeighbors) -> list[tuple[int, float]]:
+    ids = np.frombuffer(row.neighbor_ids, dtype=np.int64)
+    scores = np.frombuffer(row.scores, dtype=np.float32)
+    return [(int(i), float(s)) for i, s in zip(ids, scores)]
+
+
+def _merge(current: list[tuple[int, float]], offered: list[tuple[int, float]]) -> list[tuple[int, float]]:
+    best = dict(current)
+    for note_id, score in offered:
+        if score > best.get(note_id, -np.inf):
+            best[note_id] = score
+    return sorted(best.items(), key=lambda hit: -hit[1])[:RELATED_TOP_N]
+
+
+def user_index(user_id: str, model_name: str) -> UserIndex:
+    def build():
+        with SessionLocal() as db:
+            return load_user_index(db, user_id, model_name)
+
+    return vector_index.get_or_build((user_id, model_name), build)
+
+
+def _rows(db, model_name: str, note_ids: list[int]) -> dict[int, NoteNeighbors]:
+    rows = {}
+    for start in range(0, len(note_ids), IN_CHUNK):
+        stmt = (
+            select(NoteNeighbors)
+            .where(NoteNeighbors.model_name == model_name)
+            .where(NoteNeighbors.note_id.in_(note_ids[start:start + IN_CHUNK]))
+            .with_for_update()  # Postgres: serialize merges with other processes
+        )
+        rows.update((row.note_id, row) for row in db.scalars(stmt))
+    return rows
+
+
+def refresh_neighbors(user_id: str, model_name: str, note_ids: list[int]) -> None:
+    """Write the lists of notes just added to vector_index and offer them to their neighbours' lists."""
+    index = user_index(user_id, model_name)
+    matrix, ids, _ = index.snapshot()
+    rows = np.flatnonzero(np.isin(ids, np.asarray(note_ids, dtype=np.int64)))
+    if not len(rows):
+        return
+    new_ids = ids[rows].tolist()
+    fresh = set(new_ids)
+    results = index.search_many(matrix[rows], max(RELATED_TOP_N, RELATED_REVERSE_CANDIDATES) + 1)
+
+    forward: dict[int, list] = {}
+    offers: dict[int, list] = {}
+    for note_id, hits in zip(new_ids, results):
+        hits = [(i, s) for i, s in hits if i != note_id]
+        forward[note_id] = hits[:RELATED_TOP_N]
+        for other, score in hits[:RELATED_REVERSE_CANDIDATES]:
+            if other not in fresh:  # new notes already see each other in their forward lists
+                offers.setdefault(other, []).append((note_id, score))
+
+    for attempt in range(2):
+        with _lock, SessionLocal() as db:
+            existing = _rows(db, model_name, list(forward) + list(offers))
+            for note_id, hits in forward.items():
+                row = existing.get(note_id)
+                if row is None:
+                    row = NoteNeighbors(note_id=note_id, model_name=model_name)
+                    db.add(row)
+                for key, value in pack(hits).items():
+                    setattr(row, key, value)
+            for note_id, offered in offers.items():
+                row = existing.get(note_id)
+                # No list yet: it is computed with the new notes on first read
+                if row is None or (row.kth_score is not None and max(s for _, s in offered) <= row.kth_score):
+                    continue
+                for key, value in pack(_merge(unpack(row), offered)).items():
+                    setattr(row, key, value)
+            try:
+                db.commit()
+                return
+            except IntegrityError:
+                # A read computed one of the new lists first; retry as an update
+                db.rollback()
+                if attempt:
+                    raise
+
+
+def invalidate_user(db, user_id: str, model_name: str) -> None:
+    """Drop all of a user's lists; they are recomputed as they are read."""
+    db.execute(
+        delete(NoteNeighbors)
+        .where(NoteNeighbors.model_name == model_name)
+        .where(NoteNeighbors.note_id.in_(select(Note.id).where(Note.user_id == user_id)))
+    )
+
+
+def notes_added(user_id: str, model_name: str, note_ids: list[int]) -> None:
+    """Keep the user's lists current after note_ids were stored and added to vector_index."""
+    if len(note_ids) <= RELATED_INCREMENTAL_MAX:
+        try:
+            refresh_neighbors(user_id, model_name, note_ids)
+            return
+        except Exception:
+            logger.exception("neighbour refresh for %d notes failed; dropping the user's lists", len(note_ids))
+    with _lock, SessionLocal() as db:
+        invalidate_user(db, user_id, model_name)
+        db.commit()
+
+
+def compute_neighbors(user_id: str, model_name: str, note_id: int) -> Optional[list[tuple[int, float]]]:
+    """Compute and store note_id's list; None when the note has no vector under model_name."""
+    index = user_index(user_id, model_name)
+    matrix, ids, _ = index.snapshot()
+    pos = np.flatnonzero(ids == note_id)
+    if not len(pos):
+        return None
+    hits = [(i, s) for i, s in index.search(matrix[pos[0]], RELATED_TOP_N + 1) if i != note_id][:RELATED_TOP_N]
+
+    with _lock, SessionLocal() as db:
+        db.add(NoteNeighbors(note_id=note_id, model_name=model_name, **pack(hits)))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()  # stored concurrently; either list is current
+    return hits
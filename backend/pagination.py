@@ -0,0 +1,42 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+def keyset_page(stmt, model, limit: int, offset: int, cursor: Optional[str]):
+    """Newest-first page on (created_at, id): after cursor if given, otherwise at offset."""
+    if cursor is not None:
+        if offset:
+            raise HTTPException(status_code=400, detail="use either cursor or offset, not both")
+        created_at, row_id = decode_cursor(cursor)
+        stmt = stmt.where(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id),
+        ))
+    stmt = stmt.order_by(model.created_at.desc(), model.id.desc()).limit(limit)
+    if offset:
+        stmt = stmt.offset(offset)
+    return stmt
+
+def next_cursor(rows: list, limit: int) -> Optional[str]:
+    # A short page is the last one
+    if len(rows) < limit:
+        return None
+    return encode_cursor(rows[-1].created_at, rows[-1].id)
@@ -0,0 +1,91 @@
+"""Check that an embedding backend agrees with the torch fp32 model before switching to it.
+
+    python -m parity --backend onnx-int8              # sample of notes from DATABASE_URL
+    python -m parity --backend torch-int8 --texts notes.txt --min-cosine 0.99
+
+Reports the per-text cosine between the two backends' vectors, how many of
+each text's nearest neighbours survive the switch, and encode throughput.
+Exits non-zero when the mean cosine is below --min-cosine.
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import func, select
+
+from ann import recall_at_k
+from embedding import EMBED_BACKENDS, EMBED_BATCH_SIZE, load_model
+
+
+def _encode(backend: str, texts: list[str]) -> tuple[np.ndarray, float]:
+    model = load_model(backend)
+    model.encode(texts[:EMBED_BATCH_SIZE], batch_size=EMBED_BATCH_SIZE, normalize_embeddings=True)  # warmup
+    t0 = time.perf_counter()
+    vecs = model.encode(texts, batch_size=EMBED_BATCH_SIZE, normalize_embeddings=True)
+    return np.asarray(vecs, dtype=np.float32), len(texts) / (time.perf_counter() - t0)
+
+
+def _neighbours(vecs: np.ndarray, k: int) -> list[list[int]]:
+    scores = vecs @ vecs.T
+    np.fill_diagonal(scores, -np.inf)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return top.tolist()
+
+
+def parity_check(backend: str, texts: list[str], baseline: str = "torch", k: int = 10) -> dict:
+    """Cosine agreement and neighbour overlap of `backend` against `baseline` on the same texts."""
+    ref, ref_rate = _encode(baseline, texts)
+    vecs, rate = _encode(backend, texts)
+    cos = (ref * vecs).sum(axis=1)  # both sides are unit vectors
+    k = min(k, len(texts) - 1)
+    return {
+        "backend": backend,
+        "baseline": baseline,
+        "texts": len(texts),
+        "cosine_mean": round(float(cos.mean()), 6),
+        "cosine_min": round(float(cos.min()), 6),
+        "cosine_p01": round(float(np.percentile(cos, 1)), 6),
+        "neighbour_recall_at_k": round(recall_at_k(_neighbours(ref, k), _neighbours(vecs, k)), 4) if k > 0 else None,
+        "k": k,
+        "baseline_texts_per_s": round(ref_rate, 1),
+        "texts_per_s": round(rate, 1),
+    }
+
+
+def _sample_notes(n: int) -> list[str]:
+    from db import SessionLocal
+    from models import Note
+
+    with SessionLocal() as db:
+        return list(db.scalars(select(Note.text).order_by(func.random()).limit(n)))
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", required=True, choices=sorted(EMBED_BACKENDS))
+    parser.add_argument("--baseline", default="torch", choices=sorted(EMBED_BACKENDS))
+    parser.add_argument("--texts", help="file with one text per line (default: a sample of stored notes)")
+    parser.add_argument("--sample", type=int, default=500, help="notes to sample when --texts is not given")
+    parser.add_argument("-k", type=int, default=10, help="neighbours compared per text")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="fail below this mean cosine")
+    args = parser.parse_args(argv)
+
+    if args.texts:
+        with open(args.texts) as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = _sample_notes(args.sample)
+    if len(texts) < 2:
+        print("need at least 2 texts to compare", file=sys.stderr)
+        return 2
+
+    report = parity_check(args.backend, texts, baseline=args.baseline, k=args.k)
+    print(json.dumps(report, indent=2))
+    return 0 if report["cosine_mean"] >= args.min_cosine else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
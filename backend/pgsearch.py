@@ -0,0 +1,101 @@
+import logging
+import os
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import select, text, update
+
+from db import PGVECTOR_DIM, PGVECTOR_ENABLED, SessionLocal
+from models import Note, NoteEmbedding
+from vectors import load_vec
+
+logger = logging.getLogger(__name__)
+
+# HNSW candidate list size for approx queries; raised to k when k is larger
+PGVECTOR_EF_SEARCH = int(os.getenv("PGVECTOR_EF_SEARCH", "40"))
+PGVECTOR_BACKFILL_BATCH = 1000
+
+# The HNSW index spans every user and model, and the user/model/book filters apply
+# after the index scan. pgvector >= 0.8 keeps scanning until k rows pass them
+# (iterative_scan); older versions stop after ef_search candidates, so approx
+# search can return fewer than k hits for users who are a small share of the table.
+_iterative_scan: Optional[bool] = None
+
+
+async def _supports_iterative_scan(db) -> bool:
+    global _iterative_scan
+    if _iterative_scan is None:
+        version = (await db.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'"))).scalar()
+        parts = tuple(int(p) for p in (version or "0").split(".")[:2] if p.isdigit())
+        _iterative_scan = parts >= (0, 8)
+    return _iterative_scan
+
+async def pgvector_search(
+    db,
+    user_id: str,
+    model_name: str,
+    q_vec: np.ndarray,
+    k: int,
+    book_id: Optional[int] = None,
+    exact: bool = False,
+    note_ids: Optional[list[int]] = None,
+) -> list[tuple[int, float]]:
+    """Top-k (note_id, cosine similarity) ranked inside Postgres; only k rows cross the wire."""
+    assert PGVECTOR_ENABLED
+    distance = NoteEmbedding.embedding_vec.cosine_distance(np.asarray(q_vec, dtype=np.float32))
+    stmt = (
+        select(NoteEmbedding.note_id, (1 - distance).label("score"))
+        .join(Note, Note.id == NoteEmbedding.note_id)
+        .where(Note.user_id == user_id)
+        .where(NoteEmbedding.model_name == model_name)
+        .where(NoteEmbedding.embedding_vec.is_not(None))  # rows written while USE_PGVECTOR was off
+        .order_by(distance)
+        .limit(k)
+    )
+    if book_id is not None:
+        stmt = stmt.where(Note.book_id == book_id)
+    if note_ids is not None:
+        stmt = stmt.where(NoteEmbedding.note_id.in_(note_ids))
+
+    # SET LOCAL only lasts for this transaction
+    if exact:
+        # Skip the HNSW index so results match the numpy exact path
+        await db.execute(text("SET LOCAL enable_indexscan = off"))
+    else:
+        await db.execute(text(f"SET LOCAL hnsw.ef_search = {max(PGVECTOR_EF_SEARCH, k)}"))
+        if await _supports_iterative_scan(db):
+            await db.execute(text("SET LOCAL hnsw.iterative_scan = strict_order"))
+    rows = (await db.execute(stmt)).all()
+    return [(int(note_id), float(score)) for note_id, score in rows]
+
+
+def backfill_vectors() -> int:
+    """Fill embedding_vec for rows stored while USE_PGVECTOR was off; returns how many were filled."""
+    assert PGVECTOR_ENABLED
+    filled, last_id = 0, 0
+    while True:
+        with SessionLocal() as db:
+            rows = db.execute(
+                select(
+                    NoteEmbedding.id,
+                    NoteEmbedding.embedding_blob,
+                    NoteEmbedding.embedding_dtype,
+                    NoteEmbedding.embedding_dim,
+                    NoteEmbedding.embedding_json,
+                )
+                .where(NoteEmbedding.id > last_id)
+                .where(NoteEmbedding.embedding_vec.is_(None))
+                .order_by(NoteEmbedding.id)
+                .limit(PGVECTOR_BACKFILL_BATCH)
+            ).all()
+            if not rows:
+                return filled
+            vecs = [(row.id, load_vec(row)) for row in rows]
+            # Vectors of another dimension (a different model) stay on the numpy path
+            values = [{"id": row_id, "embedding_vec": vec} for row_id, vec in vecs if vec.shape[0] == PGVECTOR_DIM]
+            if values:
+                db.execute(update(NoteEmbedding), values)
+                db.commit()
+            filled += len(values)
+            last_id = rows[-1].id
+        logger.info("backfilled %d pgvector embeddings", filled)
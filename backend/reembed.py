@@ -0,0 +1,208 @@
+"""Re-embed every note with the configured model, then make it the active one.
+
+    EMBED_MODEL=BAAI/bge-small-en-v1.5 python -m reembed   # fill, then switch search over
+    python -m reembed --status                             # coverage of the configured model
+    python -m reembed --no-switch                          # fill only, e.g. to compare first
+
+or set REEMBED_BACKGROUND=1 on one API process to run the same job in a thread.
+
+Vectors for the new model are written next to the active model's rows, which
+keep serving search meanwhile. Work is found by asking for notes without a
+row for the new model, so a stopped job resumes where it left off, and it is
+throttled to REEMBED_RATE notes/s so it does not starve request traffic.
+Once no note is missing a vector the active model in app_settings is switched
+in one transaction, and every process follows within ACTIVE_MODEL_TTL_SECONDS.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import exists, func, select
+from sqlalchemy.exc import IntegrityError
+
+from db import SessionLocal
+from embedding import ACTIVE_MODEL_TTL_SECONDS, EMBED_BATCH_SIZE, active_model, configured_model_name, embed_texts, split_model_name
+from index import vector_index
+from logs import configure_logging
+from models import Note, NoteEmbedding
+from vectors import embedding_fields
+
+logger = logging.getLogger(__name__)
+
+REEMBED_BATCH = int(os.getenv("REEMBED_BATCH", str(EMBED_BATCH_SIZE)))
+# Notes embedded per second at most; 0 removes the limit
+REEMBED_RATE = float(os.getenv("REEMBED_RATE", "50"))
+REEMBED_BACKGROUND = os.getenv("REEMBED_BACKGROUND", "0").lower() in ("1", "true", "yes")
+REEMBED_RETRY_SECONDS = 30.0
+
+
+def _missing(model_name: str):
+    return ~exists().where(NoteEmbedding.note_id == Note.id).where(NoteEmbedding.model_name == model_name)
+
+
+def coverage(db, model_name: str) -> dict:
+    return {
+        "model_name": model_name,
+        "active": active_model.refresh(),
+        "notes": db.scalar(select(func.count(Note.id))),
+        "missing": db.scalar(select(func.count(Note.id)).where(_missing(model_name))),
+    }
+
+
+def switch_if_complete(model_name: str) -> bool:
+    """Make model_name the active model if every note has a vector for it."""
+    with SessionLocal() as db:
+        if db.scalar(select(Note.id).where(_missing(model_name)).limit(1)) is not None:
+            return False
+        active_model.set(db, model_name)
+        db.commit()
+    return True
+
+
+class Reembedder:
+    """Fills NoteEmbedding rows for one model in note id order, then switches search to it."""
+
+    def __init__(
+        self,
+        model_name: Optional[str] = None,
+        batch_size: int = REEMBED_BATCH,
+        rate: float = REEMBED_RATE,
+        switch: bool = True,
+    ):
+        self.model_name = model_name or configured_model_name()
+        split_model_name(self.model_name)  # fail now on an unknown backend
+        self.batch_size = batch_size
+        self.rate = rate
+        self.switch = switch
+        self.filled = 0
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="reembed", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        try:
+            if active_model.refresh() != self.model_name:
+                self.run()
+        except Exception:
+            logger.exception("re-embed to %s failed; restart to resume", self.model_name)
+
+    def run(self) -> bool:
+        """Returns True once model_name is active and covers every note, False if stopped first."""
+        while not self._stopping.is_set():
+            self._sweep()
+            if self._stopping.is_set():
+                break
+            if not self.switch:
+                return False
+            if active_model.refresh() == self.model_name:
+                return True
+            if switch_if_complete(self.model_name):
+                logger.info("active embedding model is now %s", self.model_name)
+                # Processes that have not seen the switch may write a few notes under the old
+                # model until their cached name expires; the next sweep embeds those too
+                self._stopping.wait(2 * ACTIVE_MODEL_TTL_SECONDS)
+        return False
+
+    def _sweep(self) -> None:
+        """One pass over the notes that have no vector for model_name."""
+        after = 0
+        while not self._stopping.is_set():
+            t0 = time.monotonic()
+            with SessionLocal() as db:
+                rows = db.execute(
+                    select(Note.id, Note.user_id, Note.book_id, Note.text)
+                    .where(Note.id > after)
+                    .where(_missing(self.model_name))
+                    .order_by(Note.id)
+                    .limit(self.batch_size)
+                ).all()
+            if not rows:
+                return
+            try:
+                _, vecs = embed_texts([row.text for row in rows], model_name=self.model_name)
+            except Exception:
+                logger.exception("re-embedding %d notes failed; retrying", len(rows))
+                self._stopping.wait(REEMBED_RETRY_SECONDS)
+                continue
+            self.filled += self._store(rows, vecs)
+            after = rows[-1].id
+            logger.info("re-embedded %d notes with %s, up to note %d", self.filled, self.model_name, after)
+            if self.rate > 0:
+                self._stopping.wait(max(0.0, len(rows) / self.rate - (time.monotonic() - t0)))
+
+    def _store(self, rows: list, vecs) -> int:
+        with SessionLocal() as db:
+            # The embedding worker writes the active model's rows, which is this model after the switch
+            existing = set(db.scalars(
+                select(NoteEmbedding.note_id)
+                .where(NoteEmbedding.model_name == self.model_name)
+                .where(NoteEmbedding.note_id.in_([row.id for row in rows]))
+            ))
+            fresh = [(row, vec) for row, vec in zip(rows, vecs) if row.id not in existing]
+            db.add_all([NoteEmbedding(note_id=row.id, model_name=self.model_name, **embedding_fields(vec)) for row, vec in fresh])
+            try:
+                db.commit()
+            except IntegrityError:
+                # Lost a race with the worker; the next sweep picks up whatever is still missing
+                db.rollback()
+                return 0
+
+        # Only indexes already loaded for the new model (after the switch) take these; others build from the DB
+        for row, vec in fresh:
+            vector_index.add((row.user_id, self.model_name), row.id, row.book_id, vec)
+        return len(fresh)
+
+
+reembedder = Reembedder()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=configured_model_name(), help="model_name to fill (default: EMBED_MODEL with EMBED_BACKEND)")
+    parser.add_argument("--status", action="store_true", help="print coverage and exit")
+    parser.add_argument("--batch", type=int, default=REEMBED_BATCH, help="notes per encode call")
+    parser.add_argument("--rate", type=float, default=REEMBED_RATE, help="notes per second at most; 0 for no limit")
+    parser.add_argument("--no-switch", action="store_true", help="fill vectors but leave the active model alone")
+    args = parser.parse_args(argv)
+    try:
+        split_model_name(args.model)
+    except RuntimeError as e:
+        parser.error(str(e))
+
+    if args.status:
+        with SessionLocal() as db:
+            print(json.dumps(coverage(db, args.model), indent=2))
+        return 0
+
+    job = Reembedder(args.model, batch_size=args.batch, rate=args.rate, switch=not args.no_switch)
+    t0 = time.monotonic()
+    try:
+        switched = job.run()
+    except KeyboardInterrupt:
+        print(f"stopped after {job.filled} notes; run again to resume", file=sys.stderr)
+        return 130
+    with SessionLocal() as db:
+        report = coverage(db, args.model)
+    report.update(filled=job.filled, seconds=round(time.monotonic() - t0, 1), switched=switched)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    configure_logging()
+    sys.exit(main())
@@ -1,9 +1,15 @@
-import json
 import numpy as np
 
-def load_vec(embedding_json: str) -> np.ndarray:
-    return np.array(json.loads(embedding_json), dtype=np.float32)
+RRF_K = 60  # the constant from the original reciprocal-rank fusion paper
 
 def cosine_sim(a: np.ndarray, b: np.ndarray) -> float:
     # embeddings are already normalized
     return float(np.dot(a, b))
+
+def rrf_fuse(rankings: list[list[int]], k: int = RRF_K) -> list[tuple[int, float]]:
+    """Reciprocal-rank fusion of several best-first id lists."""
+    scores: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, note_id in enumerate(ranking):
+            scores[note_id] = scores.get(note_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -1,3 +1,24 @@
 #!/usr/bin/env bash
 set -e
-uvicorn main:app --host 0.0.0.0 --port ${PORT:-8000}
\ No newline at end of file
+WEB_CONCURRENCY=${WEB_CONCURRENCY:-1}
+
+if [ "$WEB_CONCURRENCY" -gt 1 ]; then
+  # Web workers share one model process, one queue worker and one mapped copy of the vectors,
+  # so memory stays roughly flat as workers are added
+  export EMBED_SERVER=${EMBED_SERVER:-/tmp/reading-notes-embed.sock}
+  # Fresh secret per start for the model process's (pickle-based) socket handshake
+  export EMBED_SERVER_AUTHKEY=${EMBED_SERVER_AUTHKEY:-$(python -c 'import secrets; print(secrets.token_hex(32))')}
+  export VECTOR_STORE_DIR=${VECTOR_STORE_DIR:-/dev/shm/reading-notes-vectors}
+  # Clear the previous run's files (named by the sha1 of the user key) and nothing else in the directory
+  sha1=$(printf '[0-9a-f]%.0s' $(seq 40))
+  if [ -d "$VECTOR_STORE_DIR" ]; then
+    find "$VECTOR_STORE_DIR" -maxdepth 1 -type f \( -name "$sha1.vec" -o -name "$sha1.ids" -o -name "$sha1.json" \
+      -o -name "$sha1.lock" -o -name "$sha1.*.tmp" \) -delete
+  fi
+  trap 'kill 0' EXIT
+  python inference.py &
+  python worker.py &
+  export EMBED_WORKERS=0
+fi
+
+uvicorn main:app --host 0.0.0.0 --port ${PORT:-8000} --workers "$WEB_CONCURRENCY"
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Modules import each other flat, as when uvicorn runs from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/tests.db")
@@ -0,0 +1,65 @@
+import numpy as np
+
+import clusters
+from clusters import incremental_labels, kmeans_clusters, mean_sq_distance
+
+
+def _corpus(n: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((4, 16))
+    return (centers[rng.integers(0, 4, n)] + 0.1 * rng.standard_normal((n, 16))).astype(np.float32)
+
+
+def test_growth_counts_every_note_since_the_fit(monkeypatch):
+    monkeypatch.setattr(clusters, "CLUSTER_REFIT_DRIFT", float("inf"))
+    X = _corpus(400)
+    ids = np.arange(1, 401, dtype=np.int64)
+
+    labels, centers = kmeans_clusters(X[:100], k=4)
+    centers = np.asarray(centers, dtype=np.float32)
+    fitted_count, fitted_spread = 100, mean_sq_distance(X[:100], labels, centers)
+    stored_ids, stored_labels = ids[:100], np.asarray(labels, dtype=np.int32)
+
+    # 15 notes per call: 15% growth after the first call, 30% after the second
+    n, calls = 100, 0
+    while True:
+        n += 15
+        calls += 1
+        assigned = incremental_labels(ids[:n], X[:n], stored_ids, stored_labels, centers, fitted_count, fitted_spread)
+        if assigned is None:
+            break
+        labels, order = assigned
+        stored_ids, stored_labels = ids[:n][order], labels[order]
+        assert set(stored_ids[:fitted_count]) == set(ids[:100])
+    assert calls == 2
+
+
+def test_cluster_results_state_round_trips(monkeypatch):
+    import main
+    from keywords import TermIndex
+    from models import ClusterResult, Note, NoteEmbedding
+    from vectors import embedding_fields
+
+    calls = []
+    fit = main.kmeans_clusters
+    monkeypatch.setattr(main, "kmeans_clusters", lambda X, k: calls.append(len(X)) or fit(X, k=k))
+    X = _corpus(101)
+    created = main.datetime.now(main.timezone.utc)
+    rows = [
+        (Note(id=i + 1, text=f"note {i}", created_at=created), NoteEmbedding(id=i + 1, **embedding_fields(X[i])))
+        for i in range(101)
+    ]
+
+    _, state = main._cluster_results(rows[:100], 4, None, False, TermIndex())
+    cached = ClusterResult(k=4, **state)
+    assert len(np.frombuffer(cached.note_ids, dtype=np.int64)) == 100
+
+    _, state = main._cluster_results(rows, 4, cached, False, TermIndex())
+    assert calls == [100]  # the added note was assigned, not refitted
+    stored_ids = np.frombuffer(state["note_ids"], dtype=np.int64)
+    stored_labels = np.frombuffer(state["labels"], dtype=np.int32)
+    assert sorted(stored_ids) == list(range(1, 102))
+    assert state["fitted_count"] == 100
+    # Labels still belong to their notes: each note sits with the other notes of its blob
+    centers = np.frombuffer(state["centroids"], dtype=np.float32).reshape(4, -1)
+    assert (np.argmax(X[stored_ids - 1] @ centers.T, axis=1) == stored_labels).mean() > 0.95
@@ -0,0 +1,50 @@
+import numpy as np
+
+import index as index_module
+from index import UserIndex
+
+
+def _index(n: int = 300, dim: int = 32) -> UserIndex:
+    rng = np.random.default_rng(0)
+    vecs = rng.standard_normal((n, dim)).astype(np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    idx = UserIndex(dim)
+    idx.add_many(np.arange(n), [None] * n, vecs)
+    return idx
+
+
+def test_explicit_quantized_bypasses_row_gate(monkeypatch):
+    idx = _index()
+    calls = []
+    original = index_module.QuantizedMatrix.scores
+    monkeypatch.setattr(index_module.QuantizedMatrix, "scores", lambda self, *a: calls.append(1) or original(self, *a))
+    q = idx.snapshot()[0][0]
+
+    idx.search(q, 5)  # QUANT_INT8 off, far below QUANT_MIN_ROWS
+    assert not calls
+    assert idx.search(q, 5, quantized=True)[0][0] == 0
+    assert calls
+
+
+def test_approx_min_rows_zero_probes_ivf():
+    idx = _index()
+    q = idx.snapshot()[0][0]
+    assert idx._ivf is None
+    idx.search(q, 5, mode="approx")  # below ANN_MIN_ROWS: exact scan, no IVF
+    assert idx._ivf is None
+    assert idx.search(q, 5, mode="approx", nprobe=1, approx_min_rows=0)[0][0] == 0
+    assert idx._ivf is not None
+
+
+def test_adds_during_build_reach_the_cached_index():
+    cache = index_module.IndexCache()
+    vec = np.ones((1, 32), dtype=np.float32)
+
+    def build():
+        cache.add_many("alice", [7], [None], vec)  # stored after the build read the DB
+        return UserIndex(32)
+
+    built = cache.get_or_build("alice", build)
+    assert cache.get("alice") is built
+    cache.add_many("alice", [8], [None], vec)
+    assert sorted(built.snapshot()[1].tolist()) == [7, 8]
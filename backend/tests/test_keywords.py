@@ -0,0 +1,12 @@
+from keywords import TermIndex
+
+
+def test_long_note_grows_document_frequencies():
+    index = TermIndex()
+    index.add_many([1], [" ".join(f"w{i}" for i in range(1100))])
+    index.add_many([2], ["w1 w2 spice"])
+
+    assert len(index) == 2
+    assert index._df[index.vocab["w1"]] == 2
+    assert index._df[index.vocab["spice"]] == 1
+    assert "spice" in index.keywords([2])
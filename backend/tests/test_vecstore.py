@@ -0,0 +1,42 @@
+import os
+
+import numpy as np
+
+import vecstore
+from index import UserIndex
+from vecstore import MappedIndexCache, MappedUserIndex
+
+
+def _build(n: int, dim: int = 64):
+    def build():
+        index = UserIndex(dim)
+        index.add_many(np.arange(1, n + 1), [None] * n, np.ones((n, dim), dtype=np.float32))
+        return index
+    return build
+
+
+def test_budget_evicts_least_recently_used_files(tmp_path, monkeypatch):
+    rows_mb = 1000 * 64 * 4 / 2**20
+    monkeypatch.setattr(vecstore, "VECTOR_STORE_MAX_MB", 2.5 * rows_mb)
+    cache = MappedIndexCache(str(tmp_path))
+
+    first = cache.get_or_build(("a", "m"), _build(1000))
+    os.utime(first.prefix + ".json", (0, 0))  # longest unused
+    cache.get_or_build(("b", "m"), _build(1000))
+    cache.get_or_build(("c", "m"), _build(1000))
+
+    assert first.evicted()
+    assert len(list(tmp_path.glob("*.ids"))) == 2
+    # The stale entry is dropped and rebuilt on the next search; appends to it are ignored meanwhile
+    first.add_many([5000], [None], np.ones((1, 64), dtype=np.float32))
+    assert cache.get(("a", "m")) is None
+    rebuilt = cache.get_or_build(("a", "m"), _build(1000))
+    assert len(rebuilt) == 1000 and not rebuilt.evicted()
+
+
+def test_evicted_index_keeps_serving_its_mapping(tmp_path):
+    cache = MappedIndexCache(str(tmp_path))
+    index = cache.get_or_build(("a", "m"), _build(10))
+    MappedUserIndex.remove(index.prefix)
+    assert len(index) == 10
+    assert index.search(np.ones(64, dtype=np.float32), 3)
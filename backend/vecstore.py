@@ -0,0 +1,249 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Hashable, Optional
+
+import numpy as np
+
+from index import INDEX_CACHE_USERS, NO_BOOK, IndexCache, UserIndex
+
+# Directory of memory-mapped vector files shared by all worker processes on the host.
+# Use a tmpfs (e.g. /dev/shm/...) cleared at deploy: the files are rebuilt from the DB on demand.
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR")
+# Budget for the files in VECTOR_STORE_DIR; beyond it the least recently searched users' files are removed
+VECTOR_STORE_MAX_MB = float(os.getenv("VECTOR_STORE_MAX_MB", "1024"))
+# Cache hits refresh a user's last-use time at most this often
+TOUCH_SECONDS = 60.0
+
+ID_COLUMNS = 2  # note_id, book_id
+
+
+@contextmanager
+def _flock(path: str):
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextmanager
+def _try_flock(path: str):
+    """Like _flock, but yields False instead of waiting when another holder has the lock."""
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class MappedUserIndex(UserIndex):
+    """UserIndex whose rows live in append-only files mapped by every process.
+
+    `<prefix>.vec` holds float32 rows and `<prefix>.ids` (note_id, book_id)
+    int64 pairs. Appends take an flock and write the vectors before the ids,
+    so the ids file length is the number of complete rows and readers never
+    need the lock. Each snapshot remaps when another process has appended.
+    The `.json` file's mtime records when the user was last searched, for
+    MappedIndexCache's eviction; an evicted index keeps its old mapping and
+    drops appends until the cache replaces it.
+    """
+
+    def __init__(self, prefix: str, dim: int):
+        self.prefix = prefix
+        self.dim = dim
+        self._size = 0
+        self._matrix = np.empty((0, dim), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._book_ids = np.empty(0, dtype=np.int64)
+        self._lock = threading.Lock()
+        self._ivf = None
+        self._ivf_lock = threading.Lock()
+        self._quant = None
+        self._touched = 0.0
+
+    @staticmethod
+    def exists(prefix: str) -> bool:
+        return os.path.exists(prefix + ".ids")
+
+    @staticmethod
+    def remove(prefix: str) -> None:
+        """Delete an index's files, ids first so it stops counting as complete; hold its flock."""
+        for suffix in (".ids", ".vec", ".json"):
+            try:
+                os.unlink(prefix + suffix)
+            except FileNotFoundError:
+                pass
+
+    def evicted(self) -> bool:
+        return not self.exists(self.prefix)
+
+    def touch(self) -> None:
+        now = time.monotonic()
+        if now - self._touched >= TOUCH_SECONDS:
+            self._touched = now
+            try:
+                os.utime(self.prefix + ".json")
+            except FileNotFoundError:
+                pass
+
+    @classmethod
+    def open(cls, prefix: str) -> "MappedUserIndex":
+        with open(prefix + ".json") as f:
+            index = cls(prefix, json.load(f)["dim"])
+        index._remap()
+        return index
+
+    @classmethod
+    def create(cls, prefix: str, index: UserIndex) -> "MappedUserIndex":
+        """Write an in-memory index out; the ids file is renamed into place last, marking it complete."""
+        matrix, ids, book_ids = index.snapshot()
+        with open(prefix + ".vec.tmp", "wb") as f:
+            f.write(np.ascontiguousarray(matrix, dtype=np.float32).tobytes())
+        with open(prefix + ".json.tmp", "w") as f:
+            json.dump({"dim": index.dim}, f)
+        with open(prefix + ".ids.tmp", "wb") as f:
+            f.write(np.column_stack([ids, book_ids]).astype(np.int64).tobytes())
+        os.replace(prefix + ".vec.tmp", prefix + ".vec")
+        os.replace(prefix + ".json.tmp", prefix + ".json")
+        os.replace(prefix + ".ids.tmp", prefix + ".ids")
+        return cls.open(prefix)
+
+    def _remap(self) -> None:
+        try:
+            rows = os.path.getsize(self.prefix + ".ids") // (8 * ID_COLUMNS)
+        except FileNotFoundError:
+            return  # evicted: the current mapping stays readable until it is dropped
+        if rows == self._size:
+            return
+        # Mapped read-only: the page cache behind these is shared by all processes
+        matrix = np.memmap(self.prefix + ".vec", dtype=np.float32, mode="r", shape=(rows, self.dim))
+        id_rows = np.memmap(self.prefix + ".ids", dtype=np.int64, mode="r", shape=(rows, ID_COLUMNS))
+        self._matrix, self._ids, self._book_ids = matrix, id_rows[:, 0], id_rows[:, 1]
+        self._size = rows
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._remap()
+            return self._size
+
+    def snapshot(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        with self._lock:
+            self._remap()
+            return self._matrix, self._ids, self._book_ids
+
+    def add_many(self, note_ids, book_ids, vecs: np.ndarray) -> None:
+        note_ids = np.asarray(note_ids, dtype=np.int64)
+        book_ids = np.asarray([NO_BOOK if b is None else b for b in book_ids], dtype=np.int64)
+        vecs = np.asarray(vecs, dtype=np.float32).reshape(len(note_ids), -1)
+        if vecs.shape[1] != self.dim:
+            raise ValueError(f"vector dim {vecs.shape[1]} does not match index dim {self.dim}")
+        with _flock(self.prefix + ".lock"), self._lock:
+            if self.evicted():
+                return  # the rows are in the DB; the next build picks them up
+            self._remap()
+            fresh = ~np.isin(note_ids, self._ids)
+            if not fresh.any():
+                return
+            with open(self.prefix + ".vec", "ab") as f:
+                f.write(np.ascontiguousarray(vecs[fresh]).tobytes())
+            with open(self.prefix + ".ids", "ab") as f:
+                f.write(np.column_stack([note_ids[fresh], book_ids[fresh]]).tobytes())
+            self._remap()
+
+
+class MappedIndexCache(IndexCache):
+    """IndexCache of MappedUserIndex, keyed like vector_index by (user_id, model_name).
+
+    Builds are serialized across processes by an flock, so one process reads
+    the user's vectors from the DB and the others map its files. Adds for keys
+    this process has not loaded still reach the files when they exist, since
+    another process may be serving that user.
+    """
+
+    def __init__(self, directory: str, max_entries: int = INDEX_CACHE_USERS):
+        super().__init__(max_entries)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _prefix(self, key: Hashable) -> str:
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode()).hexdigest())
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        index = super().get(key)
+        if index is not None:
+            if index.evicted():
+                self.evict(key)
+                return None
+            index.touch()
+        return index
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        prefix = self._prefix(key)
+        created = False
+
+        def build_mapped():
+            nonlocal created
+            with _flock(prefix + ".lock"):
+                if MappedUserIndex.exists(prefix):
+                    return MappedUserIndex.open(prefix)
+                created = True
+                return MappedUserIndex.create(prefix, build())
+
+        index = super().get_or_build(key, build_mapped)
+        if created:
+            # Outside the build lock, so two processes evicting never wait on each other's locks
+            self.enforce_budget(keep=prefix)
+        return index
+
+    def enforce_budget(self, keep: Optional[str] = None) -> None:
+        """Remove least recently searched users' files until the directory fits VECTOR_STORE_MAX_MB."""
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".vec"):
+                continue
+            prefix = os.path.join(self.directory, name[:-len(".vec")])
+            try:
+                size = os.path.getsize(prefix + ".vec") + os.path.getsize(prefix + ".ids")
+                files.append((os.path.getmtime(prefix + ".json"), size, prefix))
+            except FileNotFoundError:
+                continue
+        total = sum(size for _, size, _ in files)
+        budget = VECTOR_STORE_MAX_MB * 2**20
+        for _, size, prefix in sorted(files):
+            if total <= budget:
+                break
+            if prefix == keep:
+                continue
+            with _try_flock(prefix + ".lock") as locked:
+                if not locked:
+                    continue  # being built or appended to right now, so not idle
+                MappedUserIndex.remove(prefix)
+            total -= size
+
+    def add_many(self, key: Hashable, *args) -> None:
+        with self._lock:
+            cached = key in self._entries or key in self._building
+        if cached:
+            return super().add_many(key, *args)
+        prefix = self._prefix(key)
+        if not MappedUserIndex.exists(prefix):
+            # Taking the build lock means a build in progress elsewhere finishes first, then we append
+            with _flock(prefix + ".lock"):
+                if not MappedUserIndex.exists(prefix):
+                    return
+        try:
+            index = MappedUserIndex.open(prefix)
+        except FileNotFoundError:
+            return  # evicted meanwhile
+        index.add_many(*args)
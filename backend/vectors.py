@@ -0,0 +1,37 @@
+import json
+from typing import Optional
+
+import numpy as np
+
+from db import PGVECTOR_ENABLED
+
+# Raw little-endian float32, so rows decode with np.frombuffer and no parsing.
+VEC_DTYPE = "<f4"
+
+def to_blob(vec: np.ndarray) -> bytes:
+    return np.ascontiguousarray(vec, dtype=VEC_DTYPE).tobytes()
+
+def from_blob(blob: bytes, dtype: str = VEC_DTYPE, dim: Optional[int] = None) -> np.ndarray:
+    vec = np.frombuffer(blob, dtype=np.dtype(dtype))
+    if dim is not None and vec.shape[0] != dim:
+        raise ValueError(f"embedding blob has {vec.shape[0]} values, expected {dim}")
+    if vec.dtype != np.float32:
+        vec = vec.astype(np.float32)
+    return vec
+
+def load_vec(emb) -> np.ndarray:
+    # Rows written before the binary column existed only have embedding_json
+    if emb.embedding_blob is not None:
+        return from_blob(emb.embedding_blob, emb.embedding_dtype or VEC_DTYPE, emb.embedding_dim)
+    return np.array(json.loads(emb.embedding_json), dtype=np.float32)
+
+def embedding_fields(vec: np.ndarray) -> dict:
+    """Column values for storing vec on a NoteEmbedding row."""
+    fields = {
+        "embedding_blob": to_blob(vec),
+        "embedding_dtype": VEC_DTYPE,
+        "embedding_dim": int(vec.shape[0]),
+    }
+    if PGVECTOR_ENABLED:
+        fields["embedding_vec"] = np.asarray(vec, dtype=np.float32)
+    return fields
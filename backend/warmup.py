@@ -0,0 +1,66 @@
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Load and warm the model in the background at startup instead of on the first request
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "1").lower() in ("1", "true", "yes")
+# Failed warmups (model download, inference server or database not up yet) retry with
+# exponential backoff up to this delay, so /ready recovers once the dependency does
+WARMUP_RETRY_MAX_SECONDS = float(os.getenv("WARMUP_RETRY_MAX_SECONDS", "60"))
+
+
+class Warmup:
+    """Background load of the embedding model and the lazily imported libraries.
+
+    Only the model load decides readiness; /ready reports not-ready until it is
+    done so a load balancer keeps traffic on warm instances meanwhile.
+    """
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.error: Optional[str] = None
+        self.seconds: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def run(self) -> None:
+        # Imported here so the module itself stays cheap to import
+        import clusters
+        import keywords
+        from embedding import embed_texts, get_model_name
+
+        t0 = time.perf_counter()
+        delay = 1.0
+        while True:
+            try:
+                # The first encodes at a new batch shape are much slower than the rest
+                embed_texts(["warmup"])
+                embed_texts(["warming up the sentence embedding model"] * 8)
+                break
+            except Exception as e:
+                logger.exception("model warmup failed; retrying in %.0fs", delay)
+                self.error = repr(e)
+                time.sleep(delay)
+                delay = min(2 * delay, WARMUP_RETRY_MAX_SECONDS)
+        self.error = None
+        self.seconds = time.perf_counter() - t0
+        logger.info("model %s warm in %.1fs", get_model_name(), self.seconds)
+        self.ready.set()
+
+        try:
+            clusters.load_sklearn()
+            keywords.analyzer()
+        except Exception:
+            # Not fatal: the first clustering request retries the import and reports the error
+            logger.exception("preloading sklearn failed")
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="model-warmup", daemon=True)
+            self._thread.start()
+
+
+warmup = Warmup()
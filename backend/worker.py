@@ -0,0 +1,194 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import and_, or_, select
+
+from db import SessionLocal
+from embedding import embed_texts, get_model_name
+from index import vector_index
+from logs import configure_logging
+from models import EmbeddingJob, Note, NoteEmbedding
+from neighbors import notes_added
+from vectors import embedding_fields
+
+logger = logging.getLogger(__name__)
+
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+EMBED_JOB_BATCH = int(os.getenv("EMBED_JOB_BATCH", "32"))
+EMBED_MAX_ATTEMPTS = int(os.getenv("EMBED_MAX_ATTEMPTS", "5"))
+EMBED_POLL_SECONDS = float(os.getenv("EMBED_POLL_SECONDS", "2"))
+# Short wait after a wakeup so notes created together are embedded in one batch
+EMBED_LINGER_SECONDS = float(os.getenv("EMBED_LINGER_MS", "20")) / 1000
+# A running job not finished within this long is assumed orphaned and is claimed again
+EMBED_LEASE_SECONDS = float(os.getenv("EMBED_LEASE_SECONDS", "300"))
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def enqueue(db, note_id: int, model_name: str) -> EmbeddingJob:
+    job = EmbeddingJob(note_id=note_id, model_name=model_name, status="pending", attempts=0)
+    db.add(job)
+    return job
+
+
+class EmbeddingWorker:
+    """Thread pool draining embedding_jobs into NoteEmbedding in micro-batches."""
+
+    def __init__(self, threads: int = EMBED_WORKERS, batch_size: int = EMBED_JOB_BATCH):
+        self.threads = threads
+        self.batch_size = batch_size
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        # SQLite ignores FOR UPDATE SKIP LOCKED, so claims within one process are serialized here
+        self._claim_lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        self._stopping.clear()
+        for i in range(self.threads):
+            t = threading.Thread(target=self._run, name=f"embedding-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 10) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                processed = self.run_once()
+            except Exception:
+                logger.exception("embedding worker iteration failed")
+                processed = 0
+            if not processed:
+                self._wakeup.wait(EMBED_POLL_SECONDS)
+                self._wakeup.clear()
+                time.sleep(EMBED_LINGER_SECONDS)
+
+    def run_once(self) -> int:
+        jobs = self._claim()
+        if jobs:
+            self._process(jobs)
+        return len(jobs)
+
+    def _claim(self) -> list[tuple]:
+        now = _now()
+        with self._claim_lock, SessionLocal() as db:
+            stmt = (
+                select(EmbeddingJob, Note)
+                .join(Note, Note.id == EmbeddingJob.note_id)
+                .where(or_(
+                    and_(EmbeddingJob.status == "pending", EmbeddingJob.next_attempt_at <= now),
+                    and_(EmbeddingJob.status == "running", EmbeddingJob.updated_at < now - timedelta(seconds=EMBED_LEASE_SECONDS)),
+                ))
+                .order_by(EmbeddingJob.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True, of=EmbeddingJob)
+            )
+            rows = db.execute(stmt).all()
+            for job, _ in rows:
+                job.status = "running"
+                job.attempts += 1
+                job.updated_at = now
+            db.commit()
+            return [(job.id, job.model_name, job.attempts, note.id, note.user_id, note.book_id, note.text) for job, note in rows]
+
+    def _process(self, jobs: list[tuple]) -> None:
+        # Each job is embedded with the model it was queued under, which may be the
+        # previous active model if a re-embed switched models since
+        by_model: dict[str, list[tuple]] = {}
+        for job in jobs:
+            by_model.setdefault(job[1], []).append(job)
+        for model_name, group in by_model.items():
+            self._process_model(model_name, group)
+
+    def _process_model(self, model_name: str, jobs: list[tuple]) -> None:
+        try:
+            _, vecs = embed_texts([text for *_, text in jobs], model_name=model_name)
+        except Exception as e:
+            logger.exception("embedding batch of %d jobs failed", len(jobs))
+            self._fail(jobs, repr(e))
+            return
+
+        now = _now()
+        with SessionLocal() as db:
+            # A re-embed may have written some of these vectors already
+            existing = set(db.scalars(
+                select(NoteEmbedding.note_id)
+                .where(NoteEmbedding.model_name == model_name)
+                .where(NoteEmbedding.note_id.in_([job[3] for job in jobs]))
+            ))
+            for (job_id, _, _, note_id, *_), vec in zip(jobs, vecs):
+                if note_id not in existing:
+                    db.add(NoteEmbedding(note_id=note_id, model_name=model_name, **embedding_fields(vec)))
+                job = db.get(EmbeddingJob, job_id)
+                job.status = "done"
+                job.last_error = None
+                job.updated_at = now
+            db.commit()
+
+        by_user: dict[str, list[int]] = {}
+        for (_, _, _, note_id, user_id, book_id, _), vec in zip(jobs, vecs):
+            vector_index.add((user_id, model_name), note_id, book_id, vec)
+            by_user.setdefault(user_id, []).append(note_id)
+        for user_id, note_ids in by_user.items():
+            notes_added(user_id, model_name, note_ids)
+
+    def _fail(self, jobs: list[tuple], error: str) -> None:
+        now = _now()
+        with SessionLocal() as db:
+            for job_id, _, attempts, *_ in jobs:
+                job = db.get(EmbeddingJob, job_id)
+                job.last_error = error[:2000]
+                job.updated_at = now
+                if attempts >= EMBED_MAX_ATTEMPTS:
+                    job.status = "failed"
+                else:
+                    job.status = "pending"
+                    job.next_attempt_at = now + timedelta(seconds=2 ** attempts)
+            db.commit()
+
+
+def embedding_status(db, note_id: int) -> tuple[str, Optional[EmbeddingJob]]:
+    job = db.scalars(
+        select(EmbeddingJob).where(EmbeddingJob.note_id == note_id).order_by(EmbeddingJob.id.desc()).limit(1)
+    ).first()
+    if job is not None:
+        return job.status, job
+    # Notes embedded inline (before the queue existed, or via /notes/bulk) have no job row
+    has_embedding = db.scalars(
+        select(NoteEmbedding.id)
+        .where(NoteEmbedding.note_id == note_id)
+        .where(NoteEmbedding.model_name == get_model_name())
+        .limit(1)
+    ).first()
+    return ("done" if has_embedding is not None else "missing"), None
+
+
+embedding_worker = EmbeddingWorker()
+
+
+if __name__ == "__main__":
+    # Standalone worker, for deployments that run the API with EMBED_WORKERS=0
+    configure_logging()
+    if not os.getenv("VECTOR_STORE_DIR"):
+        raise SystemExit("set VECTOR_STORE_DIR (shared with the API processes) so embedded notes reach their search indexes")
+    embedding_worker.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        embedding_worker.stop()